@@ -0,0 +1,148 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+
+from fake_deepl import FakeDeepLServer
+
+REPOSITORY = Path(__file__).resolve().parent.parent
+DEFAULT_SCENARIO = Path(__file__).resolve().parent / 'scenarios' / 'typing.jsonl'
+DEFAULT_PREFERENCES = {
+    'keyword': 'tr',
+    'history_keyword': 'trh',
+    'api_key': 'benchmark:fx',
+    'source_language': 'select',
+    'target_language': 'select',
+    'quick_access_languages': 3,
+    'languages_per_page': 10,
+    'split_result': 65,
+    'result_lines': 20,
+    'formality': 'default',
+    'request_timeout': 5,
+    'network_retries': 1,
+    'latency_budget': 3,
+    'cache_size': 1000,
+    'speculative_delay': 0,
+    'speculative_character_limit': 5000,
+    'memory_suggestions': 3,
+    'history_retention': 365,
+    'glossary_folder': '',
+    'budget_warning': 90,
+    'budget_confirm_characters': 1000
+}
+
+
+def percentile(values, percent):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, round(percent / 100 * (len(values) - 1)))]
+
+
+def load_scenario(path):
+    with open(path, 'r') as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def create_extension(server, preferences):
+    from main import DeepLExtension
+
+    os.environ['DEEPL_SERVER_URL'] = server.url
+    extension = DeepLExtension()
+    extension.preferences.update(preferences)
+    for preference_id, value in preferences.items():
+        extension.apply_preference(preference_id, value)
+    extension.engine.usage_poller.start()
+    return extension
+
+
+def replay(extension, events, repeat):
+    timings = defaultdict(list)
+    failures = defaultdict(int)
+    for _ in range(repeat):
+        for event in events:
+            start = time.perf_counter()
+            try:
+                if event['type'] == 'input':
+                    extension.on_input(event.get('keyword', 'tr'), event.get('arg'))
+                elif event['type'] == 'enter':
+                    extension.on_enter(dict(event['data']))
+                elif event['type'] == 'sleep':
+                    time.sleep(event['seconds'])
+                    continue
+                else:
+                    raise ValueError(f'Unknown event type "{event["type"]}"')
+            except Exception:
+                failures[event['type']] += 1
+            timings[event['type']].append((time.perf_counter() - start) * 1000)
+    return timings, failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay recorded queries through DeepLExtension against a local '
+                                                 'fake DeepL server and report handler latencies.')
+    parser.add_argument('scenario', nargs='?', default=DEFAULT_SCENARIO, help='JSONL file with input/enter events')
+    parser.add_argument('--repeat', type=int, default=1, help='how often the scenario is replayed')
+    parser.add_argument('--latency', type=float, default=0.05, help='server latency in seconds')
+    parser.add_argument('--jitter', type=float, default=0.0, help='random additional latency in seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of requests that fail')
+    parser.add_argument('--error-status', type=int, default=503, help='status code of failed requests, e.g. 429')
+    parser.add_argument('--character-limit', type=int, default=500000, help='quota of the fake account')
+    parser.add_argument('--character-count', type=int, default=0, help='characters already used')
+    parser.add_argument('--preference', action='append', default=[], metavar='ID=VALUE',
+                        help='override an extension preference')
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    args = parser.parse_args()
+
+    preferences = DEFAULT_PREFERENCES.copy()
+    for preference in args.preference:
+        preference_id, value = preference.split('=', 1)
+        preferences[preference_id] = value
+
+    with tempfile.TemporaryDirectory() as data_home:
+        os.environ['XDG_DATA_HOME'] = data_home
+        sys.path.insert(0, str(REPOSITORY))
+
+        server = FakeDeepLServer(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                                 error_status=args.error_status, character_limit=args.character_limit,
+                                 character_count=args.character_count).start()
+        try:
+            extension = create_extension(server, preferences)
+            timings, failures = replay(extension, load_scenario(args.scenario), args.repeat)
+            extension.engine.close()
+        finally:
+            server.stop()
+
+    report = {
+        'handlers': {handler: {'count': len(values),
+                               'failures': failures[handler],
+                               'p50_ms': round(percentile(values, 50), 3),
+                               'p95_ms': round(percentile(values, 95), 3),
+                               'p99_ms': round(percentile(values, 99), 3),
+                               'max_ms': round(max(values), 3)}
+                     for handler, values in timings.items()},
+        'api_calls': dict(server.calls),
+        'api_errors': {str(status): count for status, count in server.errors.items()},
+        'billed_characters': server.billed_characters
+    }
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    print(f'{"handler":<10}{"count":>8}{"fail":>6}{"p50 ms":>10}{"p95 ms":>10}{"p99 ms":>10}{"max ms":>10}')
+    for handler, stats in report['handlers'].items():
+        print(f'{handler:<10}{stats["count"]:>8}{stats["failures"]:>6}{stats["p50_ms"]:>10}{stats["p95_ms"]:>10}'
+              f'{stats["p99_ms"]:>10}{stats["max_ms"]:>10}')
+    print(f'API calls: {", ".join(f"{endpoint}={count}" for endpoint, count in report["api_calls"].items())}')
+    if report['api_errors']:
+        print(f'API errors: {", ".join(f"{status}={count}" for status, count in report["api_errors"].items())}')
+    print(f'Billed characters: {report["billed_characters"]}')
+
+
+if __name__ == '__main__':
+    main()
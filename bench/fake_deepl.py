@@ -0,0 +1,130 @@
+import json
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+SOURCE_LANGUAGES = [('BG', 'Bulgarian'), ('DE', 'German'), ('EN', 'English'), ('ES', 'Spanish'), ('FR', 'French'),
+                    ('IT', 'Italian'), ('JA', 'Japanese'), ('NL', 'Dutch'), ('PL', 'Polish'), ('PT', 'Portuguese'),
+                    ('RU', 'Russian'), ('ZH', 'Chinese')]
+TARGET_LANGUAGES = [('BG', 'Bulgarian', False), ('DE', 'German', True), ('EN-GB', 'English (British)', False),
+                    ('EN-US', 'English (American)', False), ('ES', 'Spanish', True), ('FR', 'French', True),
+                    ('IT', 'Italian', True), ('JA', 'Japanese', True), ('NL', 'Dutch', True), ('PL', 'Polish', True),
+                    ('PT-BR', 'Portuguese (Brazilian)', True), ('PT-PT', 'Portuguese (European)', True),
+                    ('RU', 'Russian', True), ('ZH', 'Chinese (simplified)', False)]
+
+
+class FakeDeepLServer:
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, error_status=503, character_limit=500000,
+                 character_count=0, retry_after=1):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.character_limit = character_limit
+        self.character_count = character_count
+        self.retry_after = retry_after
+        self.lock = threading.Lock()
+        self.calls = Counter()
+        self.errors = Counter()
+        self.billed_characters = 0
+        self.server = None
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address
+        return f'http://{host}:{port}'
+
+    def start(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                fake.handle(self)
+
+            def do_POST(self):
+                fake.handle(self)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    @staticmethod
+    def read_params(request):
+        url = urlparse(request.path)
+        params = parse_qs(url.query)
+        length = int(request.headers.get('Content-Length') or 0)
+        if length:
+            body = request.rfile.read(length).decode()
+            if 'json' in (request.headers.get('Content-Type') or ''):
+                for key, value in json.loads(body).items():
+                    params[key] = value if isinstance(value, list) else [value]
+            else:
+                params.update(parse_qs(body))
+        return url.path.rstrip('/'), params
+
+    @staticmethod
+    def send(request, status, body=None, headers=None):
+        content = json.dumps(body).encode() if body is not None else b''
+        request.send_response(status)
+        request.send_header('Content-Type', 'application/json')
+        request.send_header('Content-Length', str(len(content)))
+        for key, value in (headers or {}).items():
+            request.send_header(key, value)
+        request.end_headers()
+        request.wfile.write(content)
+
+    def handle(self, request):
+        path, params = self.read_params(request)
+        endpoint = path.split('/')[-1]
+        with self.lock:
+            self.calls[endpoint] += 1
+
+        delay = self.latency + random.uniform(0, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+        if self.error_rate and random.random() < self.error_rate:
+            with self.lock:
+                self.errors[self.error_status] += 1
+            headers = {'Retry-After': str(self.retry_after)} if self.error_status == 429 else None
+            return self.send(request, self.error_status, {'message': 'Injected error'}, headers)
+
+        if endpoint == 'usage':
+            return self.send(request, 200, {'character_count': self.character_count,
+                                            'character_limit': self.character_limit})
+        if endpoint == 'languages':
+            if params.get('type', ['source'])[0] == 'target':
+                return self.send(request, 200, [{'language': code, 'name': name, 'supports_formality': formality}
+                                                for code, name, formality in TARGET_LANGUAGES])
+            return self.send(request, 200, [{'language': code, 'name': name} for code, name in SOURCE_LANGUAGES])
+        if endpoint == 'translate':
+            texts = params.get('text', [])
+            characters = sum(len(text) for text in texts)
+            with self.lock:
+                if self.character_count + characters > self.character_limit:
+                    self.errors[456] += 1
+                    return self.send(request, 456, {'message': 'Quota exceeded'})
+                self.character_count += characters
+                self.billed_characters += characters
+            target_lang = params.get('target_lang', [''])[0].upper()
+            source_lang = (params.get('source_lang') or ['EN'])[0].upper()
+            return self.send(request, 200, {'translations': [{'detected_source_language': source_lang,
+                                                              'text': f'[{target_lang}] {text}',
+                                                              'billed_characters': len(text)}
+                                                             for text in texts]})
+        return self.send(request, 404, {'message': f'Unknown endpoint "{path}"'})
@@ -0,0 +1,82 @@
+import hashlib
+import threading
+import time
+
+from storage import JsonStore
+
+RECONCILE_LAG = 60
+MAX_PERIODS = 24
+
+
+class CharacterBudget:
+
+    def __init__(self, budget_file, warning_ratio=0.9, confirm_characters=1000):
+        self.store = JsonStore(budget_file)
+        self.lock = threading.RLock()
+        self.warning_ratio = warning_ratio
+        self.confirm_characters = confirm_characters
+        self.account = {}
+
+    def set_account(self, api_key):
+        account = hashlib.sha256(api_key.encode()).hexdigest()[:16] if api_key else ''
+        with self.lock:
+            self.account = self.store.data.setdefault(account, {'period': None, 'count': None, 'limit': None,
+                                                                  'pending': 0, 'last_billed': 0, 'periods': {}})
+
+    def add(self, characters):
+        if not characters:
+            return
+        with self.lock:
+            account = self.account
+            account['pending'] += characters
+            account['last_billed'] = time.time()
+            if account['period']:
+                period = account['period']
+                account['periods'][period] = account['periods'].get(period, 0) + characters
+        self.store.save()
+
+    def reconcile(self, count, limit):
+        with self.lock:
+            account = self.account
+            now = time.time()
+            if account['count'] is None or count < account['count']:
+                # The count only goes down when a new billing period started.
+                account['period'] = time.strftime('%Y-%m-%d', time.localtime(now))
+                account['pending'] = 0
+                while len(account['periods']) >= MAX_PERIODS:
+                    del account['periods'][min(account['periods'])]
+                account['periods'].setdefault(account['period'], 0)
+            elif now - account['last_billed'] > RECONCILE_LAG:
+                account['pending'] = 0
+            else:
+                # Translations billed shortly before the poll may not be counted by the API yet.
+                account['pending'] = max(0, account['pending'] - (count - account['count']))
+            account['count'] = count
+            account['limit'] = limit
+        self.store.save()
+
+    def estimate(self):
+        with self.lock:
+            account = self.account
+            if account.get('count') is None:
+                return None, None
+            return account['count'] + account['pending'], account['limit']
+
+    def remaining(self):
+        used, limit = self.estimate()
+        return max(0, limit - used) if limit else None
+
+    def check(self, characters):
+        used, limit = self.estimate()
+        if not limit:
+            return None
+
+        after = used + characters
+        if after > limit:
+            return 'confirm'
+        if after >= limit * self.warning_ratio:
+            return 'confirm' if characters >= self.confirm_characters else 'warn'
+        return None
+
+    def flush(self):
+        self.store.flush()
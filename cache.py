@@ -0,0 +1,81 @@
+import json
+import re
+import unicodedata
+from collections import OrderedDict
+
+from storage import JsonStore
+
+
+class CachedResult:
+
+    def __init__(self, text, detected_source_lang, cached=False):
+        self.text = text
+        self.detected_source_lang = detected_source_lang
+        self.cached = cached
+
+
+def normalize_text(text):
+    text = unicodedata.normalize('NFC', text.strip())
+    return '\n'.join(re.sub(r'[ \t]+', ' ', line).strip() for line in text.splitlines())
+
+
+class TranslationCache:
+
+    def __init__(self, cache_file, max_entries=1000):
+        self.store = JsonStore(cache_file)
+        self.store.data = self.entries = OrderedDict(self.store.data)
+        self.lock = self.store.lock
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evict()
+
+    @staticmethod
+    def make_key(text, source_lang, target_lang, formality, glossary=None):
+        key = [normalize_text(text), source_lang or '', target_lang, formality or '']
+        if glossary:
+            key.append(glossary)
+        return json.dumps(key, ensure_ascii=False)
+
+    def get(self, text, source_lang, target_lang, formality, glossary=None):
+        if self.max_entries <= 0:
+            return None
+
+        key = self.make_key(text, source_lang, target_lang, formality, glossary)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+        return CachedResult(entry['text'], entry['detected_source_lang'], cached=True)
+
+    def put(self, text, source_lang, target_lang, formality, result, glossary=None):
+        if self.max_entries <= 0:
+            return
+
+        key = self.make_key(text, source_lang, target_lang, formality, glossary)
+        with self.lock:
+            self.entries[key] = {'text': result.text, 'detected_source_lang': result.detected_source_lang}
+            self.entries.move_to_end(key)
+            self.evict()
+            self.store.save()
+
+    def set_max_entries(self, max_entries):
+        self.max_entries = max_entries
+        self.evict()
+
+    def evict(self):
+        with self.lock:
+            if len(self.entries) > max(self.max_entries, 0):
+                while len(self.entries) > max(self.max_entries, 0):
+                    self.entries.popitem(last=False)
+                self.store.save()
+
+    def stats_str(self):
+        return f'Cache: {self.hits} hits, {self.misses} misses, {len(self.entries)} entries'
+
+    def flush(self):
+        self.store.flush()
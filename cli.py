@@ -0,0 +1,167 @@
+import argparse
+import json
+import logging
+import os
+import sys
+from collections import deque
+from itertools import groupby, islice
+
+from engine import TranslationEngine, LanguageNotFoundError, TRANSLATE_WORKERS, get_data_folder
+
+LOGGER = logging.getLogger(__name__)
+
+
+def open_input(file):
+    if file == '-':
+        return open(sys.stdin.fileno(), 'r', encoding='utf-8', closefd=False)
+    return open(file, 'r', encoding='utf-8')
+
+
+def read_records(files, jsonl):
+    for file in files:
+        with open_input(file) as stream:
+            for line in stream:
+                line = line.rstrip('\n')
+                if not jsonl:
+                    yield {'text': line}
+                elif line.strip():
+                    record = json.loads(line)
+                    yield record if isinstance(record, dict) else {'text': str(record)}
+
+
+def parse_records(engine, records, args):
+    for record in records:
+        try:
+            if not args.jsonl and not record['text'].strip():
+                yield record, None, [], False, '', None
+                continue
+            if args.prefixes and not args.jsonl:
+                query = engine.parse_query(record['text'], args.source, args.target)
+                source_lang, target_langs = query.source_lang, query.target_langs
+                text, no_cache = query.text, args.no_cache or query.no_cache
+            else:
+                # Lines are translated as they are by default, so e.g. "Note: ..." isn't taken for a language.
+                source_lang, _ = engine.resolve_source_language(record.get('source_lang') or args.source)
+                target_langs, _ = engine.resolve_target_languages(record.get('target_lang') or args.target)
+                text, no_cache = str(record.get('text', '')).strip(), args.no_cache
+            if not target_langs:
+                raise ValueError('No target language given.')
+        except (LanguageNotFoundError, ValueError) as error:
+            yield record, None, [], False, '', str(error)
+            continue
+        yield record, source_lang, target_langs, no_cache, text, None
+
+
+def submit_chunk(engine, chunk):
+    # Records with the same languages are translated together, so a chunk needs as few requests as possible.
+    jobs = sorted(((source_lang or '', target_lang, no_cache), i)
+                  for i, (_, source_lang, target_langs, no_cache, text, _) in enumerate(chunk) if text
+                  for target_lang in target_langs)
+    futures = []
+    for (source_lang, target_lang, no_cache), group in groupby(jobs, key=lambda job: job[0]):
+        indices = [i for _, i in group]
+        futures.append((target_lang, indices, engine.executor.submit(
+            engine.translate_batch, [chunk[i][4] for i in indices], source_lang or None, target_lang, no_cache)))
+    return futures
+
+
+def write_chunk(chunk, futures, jsonl, output):
+    translations = [{} for _ in chunk]
+    errors = [error for *_, error in chunk]
+    for target_lang, indices, future in futures:
+        try:
+            results = future.result()
+        except Exception as error:
+            LOGGER.error(f'Could not translate to {target_lang}: {error}')
+            for i in indices:
+                errors[i] = str(error)
+            continue
+        for i, result in zip(indices, results):
+            translations[i][target_lang] = result
+
+    for (record, source_lang, target_langs, *_), results, error in zip(chunk, translations, errors):
+        if jsonl:
+            line = record | {'translations': {target_lang: result.text for target_lang, result in results.items()}}
+            if results:
+                line['detected_source_lang'] = source_lang or next(iter(results.values())).detected_source_lang
+            if error:
+                line['error'] = error
+            output.write(json.dumps(line, ensure_ascii=False) + '\n')
+        else:
+            if error:
+                LOGGER.error(f'Could not translate "{record["text"]}": {error}')
+            output.write('\t'.join(results[target_lang].text.replace('\n', ' ') if target_lang in results else ''
+                                   for target_lang in target_langs) + '\n')
+    output.flush()
+    return not any(errors)
+
+
+def run(engine, args, output):
+    records = parse_records(engine, read_records(args.files or ['-'], args.jsonl), args)
+    pending = deque()
+    success = True
+    while True:
+        chunk = list(islice(records, args.batch_size))
+        if chunk:
+            pending.append((chunk, submit_chunk(engine, chunk)))
+        # Only a few chunks are in flight at once, so memory stays constant however long the input is.
+        while pending and (len(pending) > args.workers or not chunk):
+            success = write_chunk(*pending.popleft(), args.jsonl, output) and success
+        if not chunk:
+            return success
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Translate text with DeepL using the cache, glossaries and '
+                                                 'preferences of the Ulauncher extension. Every input line is '
+                                                 'translated on its own.')
+    parser.add_argument('files', nargs='*', help='input files, "-" or nothing for stdin')
+    parser.add_argument('--api-key', default=os.environ.get('DEEPL_AUTH_KEY'),
+                        help='DeepL API key, defaults to the DEEPL_AUTH_KEY environment variable')
+    parser.add_argument('--from', dest='source', default='auto', help='source language, defaults to auto')
+    parser.add_argument('--to', dest='target', default='select',
+                        help='target language, several languages are separated by commas')
+    parser.add_argument('--formality', default='default', help='default, more, less, prefer_more or prefer_less')
+    parser.add_argument('--jsonl', action='store_true',
+                        help='read JSON lines with "text" and optionally "source_lang" and "target_lang" and write '
+                             'them with their "translations"')
+    parser.add_argument('--prefixes', action='store_true',
+                        help='lines may start with from:to and ! like in Ulauncher, ignored with --jsonl')
+    parser.add_argument('--no-cache', action='store_true', help='bypass the translation cache')
+    parser.add_argument('--batch-size', type=int, default=50, help='lines per chunk, defaults to 50')
+    parser.add_argument('--workers', type=int, default=TRANSLATE_WORKERS,
+                        help=f'concurrent requests, defaults to {TRANSLATE_WORKERS}')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING, format='%(levelname)s: %(message)s')
+
+    if not args.api_key:
+        parser.error('an API key is required (--api-key or DEEPL_AUTH_KEY)')
+    if args.source.lower() == 'select':
+        args.source = 'auto'
+    args.batch_size = max(args.batch_size, 1)
+    args.workers = max(args.workers, 1)
+
+    engine = TranslationEngine(get_data_folder(), workers=args.workers)
+    engine.loaded.wait()
+    if engine.load_error:
+        LOGGER.error(f'The data of the extension could not be loaded: {engine.load_error}')
+        sys.exit(1)
+    engine.apply_preference('formality', args.formality)
+    engine.apply_preference('api_key', args.api_key)
+    engine.translator_ready.wait()
+    if not engine.translator:
+        LOGGER.error('The translator could not be initialized. Please validate that your API key is correct.')
+        sys.exit(1)
+    engine.glossaries.sync()
+
+    try:
+        success = run(engine, args, sys.stdout)
+    except KeyboardInterrupt:
+        success = False
+    finally:
+        engine.close()
+    sys.exit(0 if success else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+import hashlib
+import logging
+import os
+import shutil
+import threading
+import time
+
+from storage import JsonStore
+
+LOGGER = logging.getLogger(__name__)
+
+DOCUMENT_TYPES = ('.docx', '.pdf', '.txt', '.html', '.htm')
+# DeepL bills at least this many characters per document.
+MIN_BILLED_CHARACTERS = 50000
+
+
+def hash_file(path):
+    content_hash = hashlib.sha256()
+    with path.open('rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            content_hash.update(block)
+    return content_hash.hexdigest()
+
+
+def estimate_characters(path):
+    # The file size is only a rough estimate of the text in a document, but it is known before the upload.
+    return max(path.stat().st_size, MIN_BILLED_CHARACTERS)
+
+
+def copy_atomic(source, destination):
+    tmp_file = destination.with_name(f'.{destination.name}.tmp')
+    shutil.copyfile(source, tmp_file)
+    os.replace(tmp_file, destination)
+
+
+class DocumentJob:
+
+    def __init__(self, input_path, output_path, source_lang, target_lang):
+        self.input_path = input_path
+        self.output_path = output_path
+        self.source_lang = source_lang
+        self.target_lang = target_lang
+        self.status = 'waiting'
+        self.seconds_remaining = None
+        self.billed_characters = None
+        self.error = None
+        self.cached = False
+        self.finished = threading.Event()
+
+
+class DocumentTranslator:
+
+    def __init__(self, cache_folder, cache_file, upload, get_status, download, max_entries=20, poll_interval=1.0):
+        self.cache_folder = cache_folder
+        self.store = JsonStore(cache_file)
+        self.upload = upload
+        self.get_status = get_status
+        self.download = download
+        self.max_entries = max_entries
+        self.poll_interval = poll_interval
+        self.lock = threading.Lock()
+        self.jobs = {}
+
+    @staticmethod
+    def get_output_path(path, target_lang):
+        # An existing file may have been edited since, so it is never overwritten.
+        output_path = path.with_name(f'{path.stem}.{target_lang.lower()}{path.suffix}')
+        number = 2
+        while output_path.exists():
+            output_path = path.with_name(f'{path.stem}.{target_lang.lower()} ({number}){path.suffix}')
+            number += 1
+        return output_path
+
+    def get_job(self, path, target_lang):
+        return self.jobs.get((str(path), target_lang))
+
+    def start(self, path, source_lang, target_lang, formality, glossary):
+        with self.lock:
+            job = self.jobs.get((str(path), target_lang))
+            if job and not job.finished.is_set():
+                return job
+            job = self.jobs[(str(path), target_lang)] = DocumentJob(path, self.get_output_path(path, target_lang),
+                                                                   source_lang, target_lang)
+
+        threading.Thread(target=self.run, args=(job, formality, glossary), daemon=True).start()
+        return job
+
+    def run(self, job, formality, glossary):
+        try:
+            job.status = 'reading'
+            key = hashlib.sha256(f'{hash_file(job.input_path)} {job.source_lang} {job.target_lang} {formality} '
+                                 f'{glossary}'.encode()).hexdigest()
+            cached_file = self.cache_folder / f'{key}{job.input_path.suffix.lower()}'
+            if key in self.store.data and cached_file.exists():
+                job.cached = True
+            else:
+                self.translate(job, cached_file, formality, glossary)
+                with self.store.lock:
+                    self.store.data[key] = time.time()
+                    self.evict()
+                self.store.save()
+
+            copy_atomic(cached_file, job.output_path)
+            job.status = 'done'
+        except Exception as error:
+            LOGGER.error(f'Could not translate "{job.input_path}": {error}')
+            job.status = 'error'
+            job.error = str(error)
+        finally:
+            job.finished.set()
+
+    def translate(self, job, cached_file, formality, glossary):
+        job.status = 'uploading'
+        handle = self.upload(job.input_path, job.source_lang, job.target_lang, formality, glossary)
+        while True:
+            status = self.get_status(handle)
+            job.status = status.status.value
+            job.seconds_remaining = status.seconds_remaining
+            if not status.ok:
+                raise IOError(status.error_message or 'DeepL could not translate the document')
+            if status.done:
+                break
+            time.sleep(min(max(status.seconds_remaining or 0, self.poll_interval), 5))
+
+        job.status = 'downloading'
+        job.billed_characters = status.billed_characters
+        self.cache_folder.mkdir(exist_ok=True)
+        tmp_file = cached_file.with_name(f'{cached_file.name}.tmp')
+        with tmp_file.open('wb') as file:
+            self.download(handle, file)
+        os.replace(tmp_file, cached_file)
+
+    def evict(self):
+        while len(self.store.data) > self.max_entries:
+            key = min(self.store.data, key=self.store.data.get)
+            del self.store.data[key]
+            for cached_file in self.cache_folder.glob(f'{key}.*'):
+                cached_file.unlink(missing_ok=True)
+
+    def flush(self):
+        self.store.flush()
@@ -0,0 +1,493 @@
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from budget import CharacterBudget
+from cache import TranslationCache, CachedResult
+from documents import DocumentTranslator
+from glossary import GlossaryStore
+from history import HistoryStore
+from languages import LanguageStore
+from memory import TranslationMemory
+from ranking import FrecencyRanking
+from scheduler import ApiScheduler, INTERACTIVE, BACKGROUND, REFRESH
+from singleflight import SingleFlight
+from stats import Stats
+from segments import split_segments, join_segments, unique_segments
+from speculative import SpeculativeTranslator
+from storage import JsonStore
+from usage import UsagePoller
+
+LOGGER = logging.getLogger(__name__)
+
+TRANSLATE_WORKERS = 4
+SEGMENT_MIN_LENGTH = 300
+SEGMENT_BATCH_SIZE = 50
+API_LANES = {'translate_text': INTERACTIVE, 'translate_document_upload': BACKGROUND,
+             'translate_document_get_status': BACKGROUND, 'translate_document_download': BACKGROUND}
+# These may have taken effect even if the request failed, so they are only sent again after a 429.
+UNSAFE_RETRIES = {'create_glossary', 'delete_glossary', 'translate_document_upload', 'translate_document_download'}
+QUERY_PATTERN = re.compile('^(?P<source>select|auto|[a-zA-Z]{2,4})?:'
+                           '(?P<target>select|[a-zA-Z]{2,4}(-[a-zA-Z]{2,4})?(,[a-zA-Z]{2,4}(-[a-zA-Z]{2,4})?)*)?'
+                           '(?P<space> )?', re.IGNORECASE)
+
+
+def get_data_folder():
+    from xdg.BaseDirectory import xdg_data_home
+
+    data_folder = Path(xdg_data_home) / 'ulauncher-deepl'
+    if data_folder.is_file():
+        raise IOError(f'"{str(data_folder)}" is a file.')
+    if not data_folder.exists():
+        data_folder.mkdir()
+    return data_folder
+
+
+def create_translator(api_key, request_timeout, scheduler):
+    import deepl
+
+    # Retries are left to the scheduler, so they respect the rate limit and the priority of the request.
+    deepl.http_client.min_connection_timeout = request_timeout
+    deepl.http_client.max_network_retries = 0
+    translator = deepl.Translator(api_key, server_url=os.environ.get('DEEPL_SERVER_URL'))
+    session = getattr(getattr(translator, '_client', None), '_session', None)
+    if session is not None:
+        session.hooks['response'].append(scheduler.observe)
+    return translator
+
+
+def to_int(value, default):
+    value = str(value)
+    return int(value) if value.isnumeric() else default
+
+
+def to_float(value, default):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+class LanguageNotFoundError(Exception):
+
+    def __init__(self, kind, code, from_preferences=False):
+        super().__init__(f'{kind.capitalize()} language "{code}" not found'
+                         + (' (from preferences).' if from_preferences else '.'))
+        self.kind = kind
+        self.code = code
+        self.from_preferences = from_preferences
+
+
+class Query:
+
+    def __init__(self, text, source_lang, select_source_lang, target_langs, select_target_lang, no_cache,
+                 original_text):
+        self.text = text
+        self.source_lang = source_lang
+        self.select_source_lang = select_source_lang
+        self.target_langs = target_langs
+        self.select_target_lang = select_target_lang
+        self.no_cache = no_cache
+        self.original_text = original_text
+
+
+class TranslationEngine:
+
+    def __init__(self, data_folder, workers=TRANSLATE_WORKERS):
+        self.data_folder = data_folder
+        self.stats = Stats(data_folder / 'stats.jsonl')
+        self.loaded = threading.Event()
+        self.load_error = None
+        self.translator = None
+        self.translator_ready = threading.Event()
+        self.request_timeout = 5.0
+        self.network_retries = 1
+        self.formality = 'default'
+        self.memory = TranslationMemory()
+        self.inflight = SingleFlight()
+        self.speculative = SpeculativeTranslator()
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='translate')
+        self.scheduler = ApiScheduler(self.stats)
+        self.usage_poller = UsagePoller(self.fetch_usage)
+
+        threading.Thread(target=self.load, daemon=True).start()
+
+    def load(self):
+        with self.stats.span('startup.load'):
+            try:
+                self.store = JsonStore(self.data_folder / 'data.json')
+                self.data = self.store.data
+                self.source_ranking = self.load_ranking('source')
+                self.target_ranking = self.load_ranking('target')
+                self.translation_cache = TranslationCache(self.data_folder / 'translation_cache.json')
+                self.history = HistoryStore(self.data_folder / 'history.sqlite3')
+                self.budget = CharacterBudget(self.data_folder / 'budget.json')
+                self.languages = LanguageStore(self.data_folder / 'languages.json', {
+                    'source': lambda: self.call_api('get_source_languages'),
+                    'target': lambda: self.call_api('get_target_languages')
+                })
+                self.glossaries = GlossaryStore(
+                    self.data_folder / 'glossaries', self.data_folder / 'glossaries.json',
+                    lambda name, source_lang, target_lang, entries: self.call_api(
+                        'create_glossary', name, source_lang, target_lang, entries).glossary_id,
+                    lambda: {glossary.name: glossary.glossary_id for glossary in self.call_api('list_glossaries')},
+                    lambda glossary_id: self.call_api('delete_glossary', glossary_id))
+                self.documents = DocumentTranslator(
+                    self.data_folder / 'documents', self.data_folder / 'documents.json',
+                    self.upload_document,
+                    lambda handle: self.call_api('translate_document_get_status', handle),
+                    lambda handle, file: self.call_api('translate_document_download', handle, file))
+            except Exception as error:
+                # A half-built engine can't be used, so the error is shown instead of waiting for the translator.
+                LOGGER.error(f'Could not load the data in "{self.data_folder}": {error}')
+                self.load_error = error
+            finally:
+                self.loaded.set()
+
+        if not self.load_error:
+            self.memory.load(self.history.recent(self.memory.max_entries))
+
+    def close(self):
+        self.loaded.wait()
+        if self.load_error:
+            return
+        self.store.flush()
+        self.translation_cache.flush()
+        self.glossaries.flush()
+        self.budget.flush()
+        self.documents.flush()
+        self.history.close()
+
+    def set_api_key(self, api_key):
+        self.translator_ready.clear()
+        self.budget.set_account(api_key)
+
+        def run():
+            try:
+                with self.stats.span('startup.translator'):
+                    self.translator = create_translator(api_key, self.request_timeout,
+                                                        self.scheduler) if api_key else None
+                # Anything waiting for the translator may translate right away, so it has to use the new account's
+                # glossaries.
+                self.glossaries.set_account(api_key)
+            except Exception as error:
+                LOGGER.error(f'Could not create the translator: {error}')
+                self.translator = None
+            finally:
+                self.translator_ready.set()
+            # The timeout may have changed while the translator was created, when the settings weren't applied.
+            self.apply_http_settings()
+            if self.translator:
+                self.warm_up()
+                self.glossaries.start()
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def apply_http_settings(self):
+        # While the translator is being created, deepl may still be importing; the settings are applied afterwards.
+        if self.translator_ready.is_set() and 'deepl' in sys.modules:
+            http_client = sys.modules['deepl'].http_client
+            http_client.min_connection_timeout = self.request_timeout
+
+    def apply_preference(self, preference_id, value):
+        self.loaded.wait()
+        if self.load_error:
+            return
+        if preference_id == 'api_key':
+            self.set_api_key(value)
+        elif preference_id == 'request_timeout':
+            self.request_timeout = to_float(value, 5.0)
+            self.apply_http_settings()
+        elif preference_id == 'network_retries':
+            self.network_retries = to_int(value, 1)
+        elif preference_id == 'formality':
+            self.formality = str(value)
+        elif preference_id == 'glossary_folder':
+            self.glossaries.set_folder(Path(value).expanduser() if value and value.strip()
+                                       else self.data_folder / 'glossaries')
+        elif preference_id == 'budget_warning':
+            self.budget.warning_ratio = to_float(value, 90) / 100
+        elif preference_id == 'budget_confirm_characters':
+            self.budget.confirm_characters = to_int(value, 1000)
+        elif preference_id == 'cache_size':
+            self.translation_cache.set_max_entries(to_int(value, 1000))
+        elif preference_id == 'speculative_delay':
+            self.speculative.delay = to_float(value, 0)
+        elif preference_id == 'speculative_character_limit':
+            self.speculative.character_limit = to_int(value, 5000)
+        elif preference_id == 'stats_log':
+            self.stats.log_enabled = str(value).lower() in ('true', 'yes', '1')
+        elif preference_id == 'history_retention':
+            self.history.retention_days = to_int(value, 365)
+            self.history.prune()
+
+    def warm_up(self):
+        def run():
+            for kind in ('source', 'target'):
+                try:
+                    self.languages.get(kind)
+                except Exception as error:
+                    LOGGER.error(f'Could not warm up the translator: {error}')
+                    return
+
+        threading.Thread(target=run, daemon=True).start()
+        self.usage_poller.poll_now()
+
+    def load_ranking(self, kind):
+        if f'{kind}_frecency' not in self.data:
+            self.data[f'{kind}_frecency'] = {}
+        ranking = FrecencyRanking(self.data[f'{kind}_frecency'])
+
+        last_languages = self.data.pop(f'last_{kind}_languages', None)
+        if last_languages:
+            now = time.time()
+            for i, lang in enumerate(reversed(last_languages)):
+                ranking.record(lang, now - (len(last_languages) - i) * 60)
+            self.store.save()
+        return ranking
+
+    def get_last_source_languages(self):
+        return self.source_ranking.ranked_codes()
+
+    def get_last_target_languages(self):
+        return self.target_ranking.ranked_codes()
+
+    def set_last_source_language(self, lang):
+        # The rankings live in the store's data, which its save timer serializes in another thread.
+        with self.store.lock:
+            self.source_ranking.record(lang)
+        self.store.save()
+
+    def set_last_target_language(self, lang):
+        with self.store.lock:
+            self.target_ranking.record(lang)
+        self.store.save()
+
+    def get_source_languages(self):
+        return self.languages.get('source')
+
+    def get_target_languages(self):
+        return self.languages.get('target')
+
+    def get_source_language(self, lang_code):
+        with self.stats.span('languages.lookup'):
+            return self.languages.lookup('source', lang_code)
+
+    def get_target_language(self, lang_code):
+        with self.stats.span('languages.lookup'):
+            return self.languages.lookup('target', lang_code)
+
+    def get_source_language_name(self, lang_code):
+        language = self.get_source_language(lang_code)
+        return language.name if language else None
+
+    def get_target_language_name(self, lang_code):
+        language = self.get_target_language(lang_code)
+        return language.name if language else None
+
+    def resolve_source_language(self, source_lang, from_preferences=False):
+        source_lang = source_lang.upper()
+        if source_lang == 'AUTO':
+            return None, False
+        if source_lang == 'SELECT':
+            return None, True
+        language = self.get_source_language(source_lang)
+        if not language:
+            raise LanguageNotFoundError('source', source_lang, from_preferences)
+        return language.code, False
+
+    def resolve_target_languages(self, target_langs, from_preferences=False):
+        if target_langs.upper() == 'SELECT':
+            return [], True
+
+        codes = []
+        for target_lang in target_langs.upper().split(','):
+            language = self.get_target_language(target_lang)
+            if not language:
+                raise LanguageNotFoundError('target', target_lang, from_preferences)
+            if language.code not in codes:
+                codes.append(language.code)
+        return codes, False
+
+    def parse_query(self, arg, source_preference, target_preference):
+        source_lang, select_source_lang = self.resolve_source_language(source_preference, True)
+        target_langs, select_target_lang = self.resolve_target_languages(target_preference, True)
+
+        original_arg = arg
+        with self.stats.span('on_input.parse'):
+            match = QUERY_PATTERN.search(arg)
+        if match and match['space']:
+            if match['source']:
+                source_lang, select_source_lang = self.resolve_source_language(match['source'])
+            if match['target']:
+                target_langs, select_target_lang = self.resolve_target_languages(match['target'])
+            arg = arg[match.end():].strip()
+        elif match and arg[match.end():].strip():
+            arg = original_arg
+        elif match:
+            arg = ''
+
+        no_cache = arg.startswith('!')
+        if no_cache:
+            arg = arg[1:].strip()
+        return Query(arg, source_lang, select_source_lang, target_langs, select_target_lang, no_cache, original_arg)
+
+    def call_api(self, name, *args, **kwargs):
+        lane = self.scheduler.get_lane(API_LANES.get(name, REFRESH))
+        with self.stats.span(f'api.{name}'):
+            result = self.scheduler.call(lane, lambda: getattr(self.translator, name)(*args, **kwargs),
+                                         self.network_retries, name not in UNSAFE_RETRIES)
+        if name == 'translate_text':
+            self.budget.add(sum(getattr(text_result, 'billed_characters', None) or 0
+                                for text_result in (result if isinstance(result, list) else [result])))
+        elif name == 'translate_document_get_status' and result.done:
+            self.budget.add(result.billed_characters)
+        return result
+
+    def fetch_usage(self):
+        self.translator_ready.wait()
+        translator = self.translator
+        if not translator:
+            return None
+        usage = self.call_api('get_usage')
+        if translator is not self.translator or not self.translator_ready.is_set():
+            # The API key changed meanwhile, so the usage belongs to the previous account.
+            return None
+        if usage.character.valid:
+            self.budget.reconcile(usage.character.count, usage.character.limit)
+        return usage
+
+    def get_formality(self, target_lang):
+        from deepl import Formality
+
+        target_language = self.get_target_language(target_lang)
+        if target_language and target_language.supports_formality:
+            try:
+                return Formality[self.formality.upper()]
+            except KeyError:
+                pass
+        return Formality.DEFAULT
+
+    def translate(self, text, source_lang, target_lang, no_cache=False):
+        from deepl import GlossaryNotFoundException
+
+        formality = self.get_formality(target_lang)
+        glossary = self.glossaries.get(source_lang, target_lang)
+        if not no_cache:
+            with self.stats.span('cache.lookup'):
+                result = self.translation_cache.get(text, source_lang, target_lang, formality.value, glossary)
+            if result:
+                return result
+
+        key = self.translation_cache.make_key(text, source_lang, target_lang, formality.value, glossary)
+        try:
+            result = self.inflight.do(key, lambda: self.request_translation(text, source_lang, target_lang,
+                                                                            formality, glossary, no_cache))
+        except GlossaryNotFoundException:
+            if not glossary:
+                raise
+            LOGGER.warning(f'Glossary {glossary} does not exist anymore, it will be uploaded again')
+            self.glossaries.forget(glossary)
+            return self.translate(text, source_lang, target_lang, no_cache)
+
+        self.translation_cache.put(text, source_lang, target_lang, formality.value, result, glossary)
+        self.usage_poller.poll_now()
+        return result
+
+    def translate_batch(self, texts, source_lang, target_lang, no_cache=False):
+        from deepl import GlossaryNotFoundException
+
+        formality = self.get_formality(target_lang)
+        glossary = self.glossaries.get(source_lang, target_lang)
+        try:
+            results = self.request_batch(texts, source_lang, target_lang, formality, glossary, no_cache)
+        except GlossaryNotFoundException:
+            if not glossary:
+                raise
+            LOGGER.warning(f'Glossary {glossary} does not exist anymore, it will be uploaded again')
+            self.glossaries.forget(glossary)
+            return self.translate_batch(texts, source_lang, target_lang, no_cache)
+
+        self.usage_poller.poll_now()
+        return results
+
+    def request_translation(self, text, source_lang, target_lang, formality, glossary=None, no_cache=False):
+        segments, layout = split_segments(text)
+        if len(text) < SEGMENT_MIN_LENGTH or len(segments) < 2:
+            return self.call_api('translate_text', text, source_lang=source_lang, target_lang=target_lang,
+                                 formality=formality, glossary=glossary)
+
+        results = self.request_batch(segments, source_lang, target_lang, formality, glossary, no_cache)
+        detected_source_lang = Counter(result.detected_source_lang for result in results).most_common(1)[0][0]
+        return CachedResult(join_segments(layout, [result.text for result in results]), detected_source_lang,
+                            cached=all(getattr(result, 'cached', False) for result in results))
+
+    def request_batch(self, texts, source_lang, target_lang, formality, glossary=None, no_cache=False):
+        results, missing = {}, []
+        for text in unique_segments(texts):
+            result = None if no_cache else self.translation_cache.get(text, source_lang, target_lang,
+                                                                      formality.value, glossary)
+            if result:
+                results[text] = result
+            else:
+                missing.append(text)
+
+        for i in range(0, len(missing), SEGMENT_BATCH_SIZE):
+            batch = missing[i:i + SEGMENT_BATCH_SIZE]
+            for text, result in zip(batch, self.call_api('translate_text', batch, source_lang=source_lang,
+                                                         target_lang=target_lang, formality=formality,
+                                                         glossary=glossary)):
+                results[text] = result
+                self.translation_cache.put(text, source_lang, target_lang, formality.value, result, glossary)
+
+        return [results[text] for text in texts]
+
+    def get_cache_key(self, text, source_lang, target_lang):
+        return self.translation_cache.make_key(text, source_lang, target_lang,
+                                               self.get_formality(target_lang).value,
+                                               self.glossaries.get(source_lang, target_lang))
+
+    def get_billable_characters(self, text, source_lang, target_langs, no_cache=False):
+        return sum(len(text) for target_lang in target_langs
+                   if no_cache or self.get_cache_key(text, source_lang, target_lang)
+                   not in self.translation_cache.entries)
+
+    def translate_speculatively(self, text, source_lang, target_lang):
+        formality = self.get_formality(target_lang)
+        glossary = self.glossaries.get(source_lang, target_lang)
+        key = self.translation_cache.make_key(text, source_lang, target_lang, formality.value, glossary)
+        if key in self.translation_cache.entries:
+            self.speculative.cancel()
+            return
+        if self.budget.check(len(text)):
+            # Near the quota, characters are only spent on texts that are actually translated.
+            self.speculative.cancel()
+            return
+
+        def translate():
+            with self.scheduler.lane(BACKGROUND):
+                return self.inflight.do(key, lambda: self.request_translation(text, source_lang, target_lang,
+                                                                              formality, glossary))
+
+        self.speculative.schedule(
+            key, text, translate,
+            lambda result: self.translation_cache.put(text, source_lang, target_lang, formality.value, result,
+                                                      glossary))
+
+    def upload_document(self, path, source_lang, target_lang, formality, glossary):
+        return self.call_api('translate_document_upload', path.read_bytes(), source_lang=source_lang,
+                             target_lang=target_lang, formality=formality, glossary=glossary, filename=path.name)
+
+    def translate_document(self, path, source_lang, target_lang):
+        return self.documents.start(path, source_lang, target_lang, self.get_formality(target_lang).value,
+                                    self.glossaries.get(source_lang, target_lang))
+
+    def record_translation(self, source_lang, target_lang, text, result):
+        self.history.add(source_lang, target_lang, text, result)
+        self.memory.add(source_lang, target_lang, text, result)
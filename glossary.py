@@ -0,0 +1,170 @@
+import csv
+import hashlib
+import io
+import json
+import logging
+import threading
+
+from storage import JsonStore
+
+LOGGER = logging.getLogger(__name__)
+
+DELIMITERS = {'.tsv': '\t', '.csv': ','}
+
+
+def parse_glossary(content, delimiter):
+    entries = {}
+    for row in csv.reader(io.StringIO(content), delimiter=delimiter):
+        if len(row) >= 2 and row[0].strip() and row[1].strip():
+            entries[row[0].strip()] = row[1].strip()
+    return entries
+
+
+def hash_glossary(pair, entries):
+    return hashlib.sha256(json.dumps([pair, sorted(entries.items())], ensure_ascii=False).encode()).hexdigest()
+
+
+class GlossaryStore:
+
+    def __init__(self, folder, state_file, create, find, delete, interval=10, error_interval=300):
+        self.folder = folder
+        self.store = JsonStore(state_file)
+        self.lock = self.store.lock
+        self.create = create
+        self.find = find
+        self.delete = delete
+        self.interval = interval
+        self.error_interval = error_interval
+        self.glossaries = {}
+        self.signature = None
+        self.sync_lock = threading.Lock()
+        self.wake = threading.Event()
+        self.thread = None
+
+    @staticmethod
+    def get_pair(source_lang, target_lang):
+        return f'{source_lang.split("-")[0]}-{target_lang.split("-")[0]}'.upper()
+
+    def get(self, source_lang, target_lang):
+        if not source_lang or not target_lang:
+            return None
+        entry = self.glossaries.get(self.get_pair(source_lang, target_lang))
+        return entry['glossary_id'] if entry else None
+
+    def set_account(self, api_key):
+        # Glossaries belong to an account, so the IDs are kept per API key.
+        account = hashlib.sha256(api_key.encode()).hexdigest()[:16] if api_key else ''
+        with self.lock:
+            self.glossaries = self.store.data.setdefault(account, {})
+        self.sync_soon()
+
+    def set_folder(self, folder):
+        self.folder = folder
+        self.sync_soon()
+
+    def forget(self, glossary_id):
+        with self.lock:
+            for pair, entry in list(self.glossaries.items()):
+                if entry['glossary_id'] == glossary_id:
+                    del self.glossaries[pair]
+        self.store.save()
+        self.sync_soon()
+
+    def sync_soon(self):
+        self.signature = None
+        self.wake.set()
+
+    def start(self):
+        if self.thread and self.thread.is_alive():
+            return
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while True:
+            self.wake.clear()
+            try:
+                interval = self.interval if self.sync() else self.error_interval
+            except Exception as error:
+                LOGGER.error(f'Could not sync glossaries: {error}')
+                interval = self.error_interval
+            self.wake.wait(interval)
+
+    def scan(self):
+        files = {}
+        if self.folder.is_dir():
+            for path in sorted(self.folder.iterdir()):
+                if path.suffix.lower() in DELIMITERS and path.stem.count('-') == 1 and path.is_file():
+                    files[path.stem.upper()] = path
+        return files
+
+    def sync(self):
+        with self.sync_lock:
+            return self.sync_files()
+
+    def sync_files(self):
+        files = self.scan()
+        signature = {pair: (str(path), path.stat().st_mtime_ns, path.stat().st_size) for pair, path in files.items()}
+        if signature == self.signature:
+            return True
+
+        success = True
+        uploaded = None
+        present = set()
+        for pair, path in files.items():
+            try:
+                entries = parse_glossary(path.read_text(encoding='utf-8-sig'), DELIMITERS[path.suffix.lower()])
+            except (OSError, UnicodeDecodeError, csv.Error) as error:
+                LOGGER.error(f'Could not read glossary "{path}": {error}')
+                present.add(pair)
+                success = False
+                continue
+            if not entries:
+                continue
+            present.add(pair)
+
+            content_hash = hash_glossary(pair, entries)
+            entry = self.glossaries.get(pair)
+            if entry and entry['hash'] == content_hash:
+                continue
+
+            # Glossaries are named after their content, so one that was uploaded before is reused instead of
+            # being uploaded again, e.g. after the data folder was deleted.
+            name = f'ulauncher-deepl {pair} {content_hash[:16]}'
+            try:
+                if uploaded is None:
+                    uploaded = self.find()
+                glossary_id = uploaded.get(name)
+                if not glossary_id:
+                    source_lang, target_lang = pair.split('-')
+                    glossary_id = self.create(name, source_lang, target_lang, entries)
+                    LOGGER.info(f'Uploaded glossary "{path}" ({len(entries)} entries)')
+            except Exception as error:
+                LOGGER.error(f'Could not upload glossary "{path}": {error}')
+                success = False
+                continue
+
+            with self.lock:
+                self.glossaries[pair] = {'hash': content_hash, 'glossary_id': glossary_id}
+            self.store.save()
+            if entry and entry['glossary_id'] != glossary_id:
+                self.remove(entry['glossary_id'])
+
+        for pair in set(self.glossaries) - present:
+            with self.lock:
+                entry = self.glossaries.pop(pair)
+            self.store.save()
+            self.remove(entry['glossary_id'])
+
+        if success:
+            self.signature = signature
+        return success
+
+    def remove(self, glossary_id):
+        try:
+            self.delete(glossary_id)
+        except Exception as error:
+            LOGGER.warning(f'Could not delete glossary {glossary_id}: {error}')
+
+    def flush(self):
+        self.store.flush()
@@ -0,0 +1,127 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+
+LOGGER = logging.getLogger(__name__)
+
+PRUNE_INTERVAL = 100
+
+
+class HistoryStore:
+
+    def __init__(self, db_file, retention_days=365):
+        self.retention_days = retention_days
+        self.lock = threading.Lock()
+        self.inserts = 0
+        self.connection = None
+        try:
+            self.open(db_file)
+        except sqlite3.DatabaseError as error:
+            corrupt_file = db_file.with_name(f'{db_file.name}.corrupt')
+            LOGGER.error(f'Could not open "{db_file}", moving it to "{corrupt_file}": {error}')
+            if self.connection:
+                self.connection.close()
+            os.replace(db_file, corrupt_file)
+            for suffix in ('-wal', '-shm'):
+                db_file.with_name(f'{db_file.name}{suffix}').unlink(missing_ok=True)
+            self.open(db_file)
+
+    def open(self, db_file):
+        self.connection = sqlite3.connect(str(db_file), check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.executescript('''
+            CREATE TABLE IF NOT EXISTS history (
+                id INTEGER PRIMARY KEY,
+                key TEXT NOT NULL,
+                timestamp REAL NOT NULL,
+                source_lang TEXT,
+                target_lang TEXT NOT NULL,
+                text TEXT NOT NULL,
+                result TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS history_key ON history (key);
+            CREATE INDEX IF NOT EXISTS history_timestamp ON history (timestamp);
+        ''')
+
+        try:
+            self.connection.executescript('''
+                CREATE VIRTUAL TABLE IF NOT EXISTS history_fts USING fts5(
+                    text, result, content='history', content_rowid='id', tokenize='unicode61'
+                );
+                CREATE TRIGGER IF NOT EXISTS history_insert AFTER INSERT ON history BEGIN
+                    INSERT INTO history_fts (rowid, text, result) VALUES (new.id, new.text, new.result);
+                END;
+                CREATE TRIGGER IF NOT EXISTS history_delete AFTER DELETE ON history BEGIN
+                    INSERT INTO history_fts (history_fts, rowid, text, result)
+                    VALUES ('delete', old.id, old.text, old.result);
+                END;
+            ''')
+            self.fts = True
+        except sqlite3.OperationalError as error:
+            LOGGER.warning(f'FTS5 is not available, falling back to slow history search: {error}')
+            self.fts = False
+
+        self.connection.commit()
+        self.prune()
+
+    def add(self, source_lang, target_lang, text, result):
+        if self.retention_days <= 0:
+            return
+
+        key = hashlib.sha1(json.dumps([source_lang, target_lang, text], ensure_ascii=False).encode()).hexdigest()
+        with self.lock:
+            self.connection.execute('DELETE FROM history WHERE key = ?', (key,))
+            # Re-inserting gives the entry a new, highest id, so ordering by id is ordering by recency.
+            self.connection.execute('INSERT INTO history (key, timestamp, source_lang, target_lang, text, result) '
+                                    'VALUES (?, ?, ?, ?, ?, ?)',
+                                    (key, time.time(), source_lang, target_lang, text, result))
+            self.connection.commit()
+            self.inserts += 1
+
+        if self.inserts % PRUNE_INTERVAL == 0:
+            self.prune()
+
+    def search(self, query, limit=10):
+        words = re.findall(r'\w+', query)
+        with self.lock:
+            if not words:
+                rows = self.connection.execute('SELECT timestamp, source_lang, target_lang, text, result FROM history '
+                                               'ORDER BY timestamp DESC LIMIT ?', (limit,))
+            elif self.fts:
+                match = ' '.join(f'"{word}"*' for word in words)
+                rows = self.connection.execute('SELECT h.timestamp, h.source_lang, h.target_lang, h.text, h.result '
+                                               'FROM history_fts JOIN history h ON h.id = history_fts.rowid '
+                                               'WHERE history_fts MATCH ? ORDER BY history_fts.rowid DESC LIMIT ?',
+                                               (match, limit))
+            else:
+                conditions = ' AND '.join('(text LIKE ? OR result LIKE ?)' for _ in words)
+                parameters = [f'%{word}%' for word in words for _ in range(2)]
+                rows = self.connection.execute('SELECT timestamp, source_lang, target_lang, text, result FROM history '
+                                               f'WHERE {conditions} ORDER BY timestamp DESC LIMIT ?',
+                                               parameters + [limit])
+            return rows.fetchall()
+
+    def recent(self, limit):
+        with self.lock:
+            rows = self.connection.execute('SELECT source_lang, target_lang, text, result FROM history '
+                                           'ORDER BY id DESC LIMIT ?', (limit,)).fetchall()
+        return reversed(rows)
+
+    def prune(self):
+        if self.retention_days <= 0:
+            return
+
+        with self.lock:
+            self.connection.execute('DELETE FROM history WHERE timestamp < ?',
+                                    (time.time() - self.retention_days * 24 * 3600,))
+            self.connection.commit()
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
@@ -0,0 +1,158 @@
+import json
+import logging
+import re
+import threading
+import time
+
+from singleflight import SingleFlight
+from storage import read_json, write_atomic
+
+LOGGER = logging.getLogger(__name__)
+
+PREFERRED_VARIANTS = {'EN': 'EN-US', 'PT': 'PT-PT', 'ZH': 'ZH-HANS'}
+ALIASES = {
+    'AR': ['العربية'], 'BG': ['български'], 'CS': ['čeština', 'czech'], 'DA': ['dansk'], 'DE': ['deutsch'],
+    'EL': ['ελληνικά'], 'EN-GB': ['british'], 'EN-US': ['american'], 'ES': ['español', 'castellano'], 'ET': ['eesti'],
+    'FI': ['suomi'], 'FR': ['français'], 'HU': ['magyar'], 'ID': ['bahasa indonesia'], 'IT': ['italiano'],
+    'JA': ['日本語', 'nihongo'], 'KO': ['한국어', 'hangul'], 'LT': ['lietuvių'], 'LV': ['latviešu'],
+    'NB': ['norsk', 'bokmål', 'norwegian'], 'NL': ['nederlands', 'flemish'], 'PL': ['polski'],
+    'PT': ['português'], 'PT-BR': ['brazilian'], 'RO': ['română'], 'RU': ['русский'], 'SK': ['slovenčina'],
+    'SL': ['slovenščina'], 'SV': ['svenska'], 'TR': ['türkçe'], 'UK': ['українська'],
+    'ZH': ['中文', 'mandarin'], 'ZH-HANS': ['simplified'], 'ZH-HANT': ['traditional']
+}
+
+
+class Language:
+
+    def __init__(self, code, name, supports_formality=None):
+        self.code = code
+        self.name = name
+        self.supports_formality = supports_formality
+
+    def to_dict(self):
+        return {'code': self.code, 'name': self.name, 'supports_formality': self.supports_formality}
+
+
+def build_index(languages):
+    index = {}
+    for language in languages:
+        index[language.code.upper()] = language
+
+    for language in languages:
+        code = language.code.upper()
+        if '-' in code:
+            base = code.split('-')[0]
+            if base not in index or (PREFERRED_VARIANTS.get(base) == code and index[base].code.upper() != base):
+                index[base] = language
+        else:
+            variant = PREFERRED_VARIANTS.get(code)
+            if variant and variant not in index:
+                index[variant] = language
+    return index
+
+
+def get_aliases(code):
+    # Aliases of a variant like EN-GB only belong to that variant, but also to the language without variants (EN).
+    base = code.split('-')[0]
+    variants = [code] if '-' in code else [variant for variant in ALIASES if variant.startswith(f'{base}-')]
+    return [*ALIASES.get(base, []), *(alias for variant in variants for alias in ALIASES.get(variant, []))]
+
+
+def build_search_index(languages):
+    # Maps every substring of a language's code, name and aliases to the matching languages, best matches first:
+    # exact codes, then word prefixes, then any other substring.
+    ranks = {}
+    for position, language in enumerate(languages):
+        code = language.code.lower()
+        terms = {code, code.split('-')[0], language.name.lower(), *get_aliases(code.upper())}
+        words = {word for term in terms for word in re.split(r'[\s()-]+', term) if word}
+        for term in terms | words:
+            for start in range(len(term)):
+                for end in range(start + 1, len(term) + 1):
+                    key = term[start:end]
+                    rank = 0 if key in (code, code.split('-')[0]) else 1 if start == 0 else 2
+                    if rank < ranks.setdefault(key, {}).get(position, 3):
+                        ranks[key][position] = rank
+
+    return {key: [languages[position] for position in sorted(matches, key=lambda position: (matches[position],
+                                                                                           position))]
+            for key, matches in ranks.items()}
+
+
+class LanguageStore:
+
+    def __init__(self, languages_file, fetchers, max_age=3600):
+        self.languages_file = languages_file
+        self.fetchers = fetchers
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        self.refreshing = set()
+        self.inflight = SingleFlight()
+        self.entries = {}
+        self.version = 0
+
+        try:
+            for kind, entry in read_json(self.languages_file, dict).items():
+                languages = [Language(**language) for language in entry['languages']]
+                self.entries[kind] = (entry['fetched'], languages, build_index(languages),
+                                      build_search_index(languages))
+        except (KeyError, TypeError, AttributeError) as error:
+            LOGGER.error(f'Could not load cached languages: {error}')
+
+    def get(self, kind):
+        entry = self.entries.get(kind)
+        if not entry:
+            return self.refresh(kind)
+
+        if time.time() - entry[0] >= self.max_age:
+            self.refresh_in_background(kind)
+        return entry[1]
+
+    def lookup(self, kind, code):
+        if not code:
+            return None
+        self.get(kind)
+        return self.entries[kind][2].get(code.upper())
+
+    def search(self, kind, query):
+        languages = self.get(kind)
+        if not query:
+            return languages
+        return self.entries[kind][3].get(query.lower(), [])
+
+    def refresh(self, kind):
+        return self.inflight.do(kind, lambda: self.fetch(kind))
+
+    def fetch(self, kind):
+        languages = [Language(language.code, language.name, language.supports_formality)
+                     for language in self.fetchers[kind]()]
+        with self.lock:
+            self.entries[kind] = (time.time(), languages, build_index(languages), build_search_index(languages))
+            self.version += 1
+            self.save()
+        return languages
+
+    def refresh_in_background(self, kind):
+        with self.lock:
+            if kind in self.refreshing:
+                return
+            self.refreshing.add(kind)
+
+        def run():
+            try:
+                self.refresh(kind)
+            except Exception as error:
+                LOGGER.error(f'Could not refresh {kind} languages: {error}')
+            finally:
+                with self.lock:
+                    self.refreshing.discard(kind)
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def save(self):
+        data = {kind: {'fetched': fetched, 'languages': [language.to_dict() for language in languages]}
+                for kind, (fetched, languages, *_) in self.entries.items()}
+        try:
+            write_atomic(self.languages_file, json.dumps(data))
+        except OSError as error:
+            LOGGER.error(f'Could not write "{self.languages_file}": {error}')
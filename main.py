@@ -1,27 +1,43 @@
+import time
+
+START_TIME = time.perf_counter()
+
 import json
 import logging
-import time
-import math
 import re
-from functools import cmp_to_key
+import threading
+from collections import OrderedDict
+from concurrent.futures import TimeoutError, wait
+from itertools import count
 from pathlib import Path
 
-from deepl import Translator, DeepLException, Formality
 from ulauncher.api.client.EventListener import EventListener
 from ulauncher.api.client.Extension import Extension
 from ulauncher.api.shared.action.CopyToClipboardAction import CopyToClipboardAction
 from ulauncher.api.shared.action.DoNothingAction import DoNothingAction
 from ulauncher.api.shared.action.ExtensionCustomAction import ExtensionCustomAction
 from ulauncher.api.shared.action.HideWindowAction import HideWindowAction
+from ulauncher.api.shared.action.OpenAction import OpenAction
 from ulauncher.api.shared.action.RenderResultListAction import RenderResultListAction
 from ulauncher.api.shared.action.SetUserQueryAction import SetUserQueryAction
 from ulauncher.api.shared.event import KeywordQueryEvent, ItemEnterEvent, SystemExitEvent, PreferencesUpdateEvent, \
     PreferencesEvent
 from ulauncher.api.shared.item.ExtensionResultItem import ExtensionResultItem
-from xdg.BaseDirectory import xdg_data_home
+
+from documents import DOCUMENT_TYPES, estimate_characters
+from engine import TranslationEngine, LanguageNotFoundError, get_data_folder, to_int, to_float
+from pages import PageCache, PageView
+from wrapping import wrap_page
 
 LOGGER = logging.getLogger(__name__)
 
+HISTORY_RESULTS = 10
+STARTUP_BUDGET = 50
+TRANSLATOR_WAIT = 5
+DOCUMENT_WAIT = 0.5
+KEPT_RESULTS = 16
+PREVIEW_WIDTH = 65
+
 
 class DeepLExtension(Extension):
 
@@ -33,83 +49,213 @@ class DeepLExtension(Extension):
         self.subscribe(KeywordQueryEvent, KeywordQueryEventListener())
         self.subscribe(ItemEnterEvent, ItemEnterListener())
 
-        data_folder = Path(xdg_data_home) / 'ulauncher-deepl'
-        if data_folder.is_file():
-            raise IOError(f'"{str(data_folder)}" is a file.')
-        if not data_folder.exists():
-            data_folder.mkdir()
-
-        self.data_file = data_folder / 'data.json'
-        self.data = json.load(self.data_file.open('r')) if self.data_file.exists() else {}
-        self.translator = None
-
-        self.source_languages = None
-        self.target_languages = None
-        self.last_source_language_fetch = 0
-        self.last_target_language_fetch = 0
-
-        self.usage = None
-        self.last_usage_fetch = 0
-
-    def get_last_source_languages(self):
-        if 'last_source_languages' not in self.data:
-            self.data['last_source_languages'] = []
-        return self.data['last_source_languages']
-
-    def get_last_target_languages(self):
-        if 'last_target_languages' not in self.data:
-            self.data['last_target_languages'] = []
-        return self.data['last_target_languages']
-
-    def set_last_source_language(self, lang):
-        languages = self.get_last_source_languages()
-        if lang in languages:
-            languages.remove(lang)
-        languages.insert(0, lang)
-        json.dump(self.data, self.data_file.open('w'))
-
-    def set_last_target_language(self, lang):
-        languages = self.get_last_target_languages()
-        if lang in languages:
-            languages.remove(lang)
-        languages.insert(0, lang)
-        json.dump(self.data, self.data_file.open('w'))
-
-    def get_source_languages(self):
-        current = time.time()
-        if current - self.last_source_language_fetch >= 3600:
-            self.source_languages = self.translator.get_source_languages()
-            self.last_source_language_fetch = current
-        return self.source_languages
-
-    def get_target_languages(self):
-        current = time.time()
-        if current - self.last_target_language_fetch >= 3600:
-            self.target_languages = self.translator.get_target_languages()
-            self.last_target_language_fetch = current
-        return self.target_languages
-
-    def get_source_language_name(self, lang_code):
-        for language in self.get_source_languages():
-            if language.code == lang_code:
-                return language.name
-        return None
-
-    def get_target_language_name(self, lang_code):
-        for language in self.get_target_languages():
-            if language.code == lang_code:
-                return language.name
-        return None
-
-    def get_usage(self):
-        current = time.time()
-        if current - self.last_usage_fetch >= 20:
-            self.usage = self.translator.get_usage()
-            self.last_usage_fetch = current
-        return self.usage
+        self.engine = TranslationEngine(get_data_folder())
+        self.stats = self.engine.stats
+        self.memory_suggestions = 3
+        self.result_lines = 20
+        self.results = OrderedDict()
+        self.result_ids = count()
+        self.generation = 0
+        self.generation_lock = threading.Lock()
+        self.latency_budget = 3.0
+        self.page_cache = PageCache(self.engine.executor)
+
+        startup_time = (time.perf_counter() - START_TIME) * 1000
+        self.stats.record('startup.init', startup_time)
+        if startup_time > STARTUP_BUDGET:
+            LOGGER.warning(f'Startup took {startup_time:.1f} ms, the budget is {STARTUP_BUDGET} ms')
+
+    def next_generation(self):
+        with self.generation_lock:
+            self.generation += 1
+            return self.generation
+
+    def apply_preference(self, preference_id, value):
+        if preference_id == 'latency_budget':
+            self.latency_budget = to_float(value, 3.0)
+        elif preference_id == 'memory_suggestions':
+            self.memory_suggestions = to_int(value, 3)
+        elif preference_id == 'result_lines':
+            self.result_lines = to_int(value, 20)
+        else:
+            self.engine.apply_preference(preference_id, value)
+
+    def still_working_item(self, data, name='Still translating...'):
+        return ExtensionResultItem(icon='images/icon.png',
+                                   name=name,
+                                   description='DeepL takes longer than expected. Press Enter to check again.',
+                                   highlightable=False,
+                                   on_enter=ExtensionCustomAction(data, keep_app_open=True))
+
+    def error_result(self, error):
+        LOGGER.error(error)
+        return RenderResultListAction([
+            ExtensionResultItem(icon='images/icon.png',
+                                name='An error occured',
+                                highlightable=False,
+                                on_enter=HideWindowAction())
+        ])
+
+    def get_billable_characters(self, data, target_langs):
+        return self.engine.get_billable_characters(data['text'].strip(), data['source_lang'], target_langs,
+                                                   data.get('no_cache', False))
+
+    def get_budget_warning(self, characters):
+        used, limit = self.engine.budget.estimate()
+        if not self.engine.budget.check(characters):
+            return None
+        return f'{used}/{limit} characters ({round(used / limit * 100)}%) of your quota are used, ' \
+               f'this translation needs {characters}.'
+
+    def get_budget_item(self, data, target_langs):
+        if data.get('budget_confirmed'):
+            return None
+        characters = self.get_billable_characters(data, target_langs)
+        if self.engine.budget.check(characters) != 'confirm':
+            return None
+        return self.budget_confirm_item(data, characters)
+
+    def budget_confirm_item(self, data, characters):
+        exceeds = characters > self.engine.budget.remaining()
+        return ExtensionResultItem(icon='images/icon.png',
+                                   name=f'Translating {characters} characters would '
+                                        f'{"exceed" if exceeds else "use up most of"} your quota',
+                                   description=self.get_budget_warning(characters)
+                                               + '\nPress Enter to translate anyway.',
+                                   highlightable=False,
+                                   on_enter=ExtensionCustomAction(data | {'budget_confirmed': True},
+                                                                  keep_app_open=True))
+
+    def keep_result(self, result):
+        result_id = next(self.result_ids)
+        self.results[result_id] = result
+        while len(self.results) > KEPT_RESULTS:
+            self.results.popitem(last=False)
+        return result_id
+
+    def wrap_result(self, text, page=0):
+        return wrap_page(text, to_int(self.preferences['split_result'], 0), self.result_lines, page)
+
+    def preview(self, text, lines):
+        # Earlier translations are listed on every keystroke, so long ones are only shown in part.
+        shown_text, more = wrap_page(text, to_int(self.preferences['split_result'], 0) or PREVIEW_WIDTH, lines)
+        return f'{shown_text}\u2026' if more else shown_text
+
+    def show_more_item(self, data, page, result_id, name='Show more'):
+        return ExtensionResultItem(icon='images/icon.png',
+                                   name=name,
+                                   description=f'Shows the lines from {page * self.result_lines + 1} on. Enter on the '
+                                               f'result item still copies the whole translation.',
+                                   highlightable=False,
+                                   on_enter=ExtensionCustomAction(data | {'result_page': page, 'result_id': result_id,
+                                                                          'no_cache': False}, keep_app_open=True))
+
+    def get_memory_items(self, text, target_lang=None):
+        if self.memory_suggestions <= 0:
+            return []
+
+        items = []
+        with self.stats.span('memory.search'):
+            matches = self.engine.memory.search(text, target_lang, self.memory_suggestions)
+        for score, entry in matches:
+            result = self.preview(entry.result.replace('\n', ' '), 1)
+            items.append(ExtensionResultItem(icon='images/icon.png',
+                                             name=f'{round(score * 100)}% match: {result}',
+                                             description=f'{entry.source_lang or "?"} \u27A1 {entry.target_lang}: '
+                                                         f'{self.preview(entry.text, 2)}',
+                                             highlightable=False,
+                                             on_enter=CopyToClipboardAction(entry.result)))
+        return items
+
+    def on_input_history(self, keyword, query):
+        with self.stats.span('history.search'):
+            rows = self.engine.history.search(query, HISTORY_RESULTS)
+        if not rows:
+            return RenderResultListAction([
+                ExtensionResultItem(icon='images/icon.png',
+                                    name='No translations found' if query else 'The history is empty',
+                                    highlightable=False,
+                                    on_enter=DoNothingAction())
+            ])
+
+        translate_keyword = self.preferences['keyword']
+        items = []
+        for timestamp, source_lang, target_lang, text, result in rows:
+            items.append(ExtensionResultItem(
+                icon='images/icon.png',
+                name=self.preview(result.replace('\n', ' '), 1),
+                description=f'{time.strftime("%Y-%m-%d %H:%M", time.localtime(timestamp))} '
+                            f'{source_lang or "?"} \u27A1 {target_lang}: {self.preview(text, 2)}',
+                highlightable=False,
+                on_enter=CopyToClipboardAction(result),
+                on_alt_enter=SetUserQueryAction(f'{translate_keyword} {(source_lang or "auto").lower()}:'
+                                                f'{target_lang.lower()} {text}')))
+        return RenderResultListAction(items)
+
+    def on_input_stats(self):
+        timings, counters = self.stats.summary()
+        api_calls = {name[4:]: count for name, count in sorted(counters.items()) if name.startswith('api.')}
+        queue_depth = self.engine.scheduler.queue_depth()
+        cache = self.engine.translation_cache
+        lookups = cache.hits + cache.misses
+        items = [
+            ExtensionResultItem(icon='images/icon.png',
+                                name=f'Cache hit rate: {round(cache.hits / lookups * 100, 1) if lookups else 0}%',
+                                description=cache.stats_str(),
+                                highlightable=False,
+                                on_enter=DoNothingAction()),
+            ExtensionResultItem(icon='images/icon.png',
+                                name=f'API calls: {sum(api_calls.values())}',
+                                description=', '.join(f'{name}: {count}' for name, count in api_calls.items())
+                                            or 'No API calls yet',
+                                highlightable=False,
+                                on_enter=DoNothingAction()),
+            ExtensionResultItem(icon='images/icon.png',
+                                name=f'API queue: {sum(queue_depth.values())}',
+                                description=', '.join(f'{lane}: {depth}' for lane, depth in queue_depth.items())
+                                            + f' | throttled: {counters.get("scheduler.throttled", 0)}, '
+                                              f'retries: {counters.get("scheduler.retries", 0)}',
+                                highlightable=False,
+                                on_enter=DoNothingAction())
+        ]
+        for name, timing in timings.items():
+            items.append(ExtensionResultItem(icon='images/icon.png',
+                                             name=f'{name}: p50 {timing["p50"]:.2f} ms, p95 {timing["p95"]:.2f} ms, '
+                                                  f'p99 {timing["p99"]:.2f} ms',
+                                             description=f'{timing["count"]} samples',
+                                             highlightable=False,
+                                             on_enter=DoNothingAction()))
+        return RenderResultListAction(items)
+
+    def load_error_result(self):
+        return RenderResultListAction([
+            ExtensionResultItem(icon='images/icon.png',
+                                name='The extension data could not be loaded',
+                                description=f'{self.engine.load_error}\nPlease check {self.engine.data_folder}.',
+                                highlightable=False,
+                                on_enter=HideWindowAction())
+        ])
 
     def on_input(self, keyword, arg):
-        if not self.translator:
+        self.engine.loaded.wait()
+        if self.engine.load_error:
+            return self.load_error_result()
+        if arg == 'stats:':
+            return self.on_input_stats()
+        if keyword == self.preferences.get('history_keyword'):
+            return self.on_input_history(keyword, arg or '')
+        if arg and arg.startswith('h:'):
+            return self.on_input_history(keyword, arg[2:])
+
+        if not self.engine.translator_ready.wait(TRANSLATOR_WAIT):
+            return RenderResultListAction([
+                ExtensionResultItem(icon='images/icon.png',
+                                    name='Starting the translator...',
+                                    description='Please try again in a moment.',
+                                    highlightable=False,
+                                    on_enter=DoNothingAction())
+            ])
+        if not self.engine.translator:
             return RenderResultListAction([
                 ExtensionResultItem(icon='images/icon.png',
                                     name='Translator could not be initialized',
@@ -118,10 +264,11 @@ class DeepLExtension(Extension):
                                     on_enter=HideWindowAction())
             ])
 
-        try:
-            usage = self.get_usage().character
-        except DeepLException as error:
-            LOGGER.error(error)
+        from deepl import DeepLException
+
+        with self.stats.span('on_input.usage'):
+            usage, error = self.engine.usage_poller.snapshot()
+        if not usage and error:
             return RenderResultListAction([
                 ExtensionResultItem(icon='images/icon.png',
                                     name='An error occured',
@@ -130,7 +277,8 @@ class DeepLExtension(Extension):
                                     on_enter=HideWindowAction())
             ])
 
-        if usage.limit_reached:
+        usage = usage.character if usage else None
+        if usage and (usage.limit_reached or self.engine.budget.remaining() == 0):
             return RenderResultListAction([
                 ExtensionResultItem(icon='images/icon.png',
                                     name='DeepL API Usage exceeded',
@@ -138,116 +286,69 @@ class DeepLExtension(Extension):
                                     on_enter=HideWindowAction())
             ])
 
-        source_lang = self.preferences['source_language'].upper()
-        if source_lang == 'AUTO':
-            source_lang = None
-            select_source_lang = False
-        elif source_lang == 'SELECT':
-            source_lang = None
-            select_source_lang = True
-        elif self.get_source_language_name(source_lang):
-            select_source_lang = False
-        else:
-            return RenderResultListAction([
-                ExtensionResultItem(icon='images/icon.png',
-                                    name=f'Source language "{source_lang}" not found (from preferences).',
-                                    description='Press Alt+Enter for a list of source languages.',
-                                    highlightable=False,
-                                    on_enter=HideWindowAction(),
-                                    on_alt_enter=ExtensionCustomAction({
-                                        'keyword': keyword,
-                                        'action': 'source_languages'}, keep_app_open=True))
-            ])
-
-        target_lang = self.preferences['target_language'].upper()
-        if target_lang == 'EN':
-            target_lang = 'EN-US'
-        if target_lang == 'SELECT':
-            select_target_lang = True
-        elif self.get_target_language_name(target_lang):
-            select_target_lang = False
-        else:
+        try:
+            query = self.engine.parse_query(arg or '', self.preferences['source_language'],
+                                            self.preferences['target_language'])
+        except LanguageNotFoundError as error:
             return RenderResultListAction([
                 ExtensionResultItem(icon='images/icon.png',
-                                    name=f'Target language "{target_lang}" not found (from preferences).',
-                                    description='Press Alt+Enter for a list of target languages.',
+                                    name=str(error),
+                                    description=f'Press Alt+Enter for a list of {error.kind} languages.',
                                     highlightable=False,
                                     on_enter=HideWindowAction(),
                                     on_alt_enter=ExtensionCustomAction({
                                         'keyword': keyword,
-                                        'action': 'target_languages'}, keep_app_open=True))
+                                        'action': f'{error.kind}_languages'}, keep_app_open=True))
             ])
+        except DeepLException as error:
+            # Without cached languages they are fetched right away, which fails if DeepL can't be reached.
+            return self.error_result(error)
 
-        usage_str = f'Usage: {usage.count}/{usage.limit} ({round(usage.count / usage.limit * 10000) / 100}%)'
-        if not arg:
+        if arg:
+            with self.stats.span('on_input.language_search'):
+                search = re.search(r'^(?P<source>[^\s:,]*):(?P<targets>([^\s:,]+,)*)(?P<query>[^\s:,]*)$', arg)
+                try:
+                    search_result = self.on_input_language_search(keyword, search) if search else None
+                except DeepLException as error:
+                    return self.error_result(error)
+            if search_result:
+                return search_result
+
+        used, limit = self.engine.budget.estimate()
+        usage_str = (f'Usage: {used}/{limit} ({round(used / limit * 10000) / 100}%)'
+                     if usage and limit else 'Usage: loading...') + f'\n{self.engine.translation_cache.stats_str()}'
+        if not query.text:
             return RenderResultListAction([
                 ExtensionResultItem(icon='images/icon.png',
                                     name='Enter text...',
-                                    description=usage_str,
+                                    description='The translation cache will be bypassed.' if query.no_cache
+                                    else usage_str,
                                     highlightable=False,
                                     on_enter=DoNothingAction())
             ])
 
-        original_arg = arg
-        match = re.search('^(?P<source>select|auto|[a-zA-Z]{2,4})?:(?P<target>select|[a-zA-Z]{2,4}(-[a-zA-Z]{2,4})?)?(?P<space> )?', arg,
-                          re.IGNORECASE)
-        if match:
-            if match['space']:
-                if match['source']:
-                    source_lang = match['source'].upper()
-                    if source_lang == 'AUTO':
-                        source_lang = None
-                        select_source_lang = False
-                    elif source_lang == 'SELECT':
-                        source_lang = None
-                        select_source_lang = True
-                    elif self.get_source_language_name(source_lang):
-                        select_source_lang = False
-                    else:
-                        return RenderResultListAction([
-                            ExtensionResultItem(icon='images/icon.png',
-                                                name=f'Source language "{source_lang}" not found.',
-                                                description='Press Alt+Enter for a list of source languages.',
-                                                highlightable=False,
-                                                on_enter=HideWindowAction(),
-                                                on_alt_enter=ExtensionCustomAction({
-                                                    'keyword': keyword,
-                                                    'action': 'source_languages'}, keep_app_open=True))
-                        ])
-
-                if match['target']:
-                    target_lang = match['target'].upper()
-                    if target_lang == 'EN':
-                        target_lang = 'EN-US'
-                    if target_lang == 'SELECT':
-                        select_target_lang = True
-                    elif self.get_target_language_name(target_lang):
-                        select_target_lang = False
-                    else:
-                        return RenderResultListAction([
-                            ExtensionResultItem(icon='images/icon.png',
-                                                name=f'Target language "{target_lang}" not found.',
-                                                description='Press Alt+Enter for a list of target languages.',
-                                                highlightable=False,
-                                                on_enter=HideWindowAction(),
-                                                on_alt_enter=ExtensionCustomAction({
-                                                    'keyword': keyword,
-                                                    'action': 'target_languages'}, keep_app_open=True))
-                        ])
-
-            arg = arg[match.end():].strip()
-
-            if not arg:
-                return RenderResultListAction([
-                    ExtensionResultItem(icon='images/icon.png',
-                                        name='Enter text...',
-                                        description=usage_str,
-                                        highlightable=False,
-                                        on_enter=DoNothingAction())
-                ])
-
-            if not match['space']:
-                arg = original_arg
+        if query.text.startswith('file:'):
+            return self.on_input_document(keyword, query)
+
+        arg, original_arg, no_cache = query.text, query.original_text, query.no_cache
+        source_lang, select_source_lang = query.source_lang, query.select_source_lang
+        target_langs = query.target_langs if len(query.target_langs) > 1 else None
+        target_lang = query.target_langs[0] if query.target_langs else None
+        select_target_lang = query.select_target_lang
+
+        if target_langs:
+            data = {
+                'keyword': keyword,
+                'text': arg,
+                'original_text': original_arg,
+                'target_langs': target_langs
+            }
+            if no_cache:
+                data['no_cache'] = True
+            if not select_source_lang:
+                data['source_lang'] = source_lang
+                data['translate_directly'] = False
+            return self.on_enter(data)
 
         if not select_target_lang:
             data = {
@@ -256,6 +357,8 @@ class DeepLExtension(Extension):
                 'original_text': original_arg,
                 'target_lang': target_lang
             }
+            if no_cache:
+                data['no_cache'] = True
             if not select_source_lang:
                 data['source_lang'] = source_lang
                 data['translate_directly'] = False
@@ -266,9 +369,12 @@ class DeepLExtension(Extension):
             'text': arg,
             'original_text': original_arg
         }
+        if no_cache:
+            translate_data['no_cache'] = True
         if not select_source_lang:
             translate_data['source_lang'] = source_lang
-        items = [
+        items = self.get_memory_items(arg)
+        items.append(
             ExtensionResultItem(
                 icon='images/icon.png',
                 name='Translate text',
@@ -276,17 +382,14 @@ class DeepLExtension(Extension):
                 highlightable=False,
                 on_enter=ExtensionCustomAction(translate_data, keep_app_open=True),
                 on_alt_enter=ExtensionCustomAction(translate_data | {'source_lang': None},
-                                                   keep_app_open=True) if select_source_lang else None)
-        ]
+                                                   keep_app_open=True) if select_source_lang else None))
 
-        last_target_languages = self.get_last_target_languages()
-        quick_access_languages = str(self.preferences['quick_access_languages'])
-        for i in range(min(len(last_target_languages),
-                           int(quick_access_languages) if quick_access_languages.isnumeric() else 3)):
-            lang = last_target_languages[i]
+        last_target_languages = self.engine.get_last_target_languages()
+        quick_target_languages = last_target_languages[:to_int(self.preferences['quick_access_languages'], 3)]
+        for lang in quick_target_languages:
             items.append(ExtensionResultItem(
                 icon='images/icon.png',
-                name=f'Translate to {self.get_target_language_name(lang)}',
+                name=f'Translate to {self.engine.get_target_language_name(lang)}',
                 description='Alt+Enter to choose source language.' if select_source_lang else '',
                 highlightable=False,
                 on_enter=ExtensionCustomAction(translate_data | {'source_lang': source_lang,
@@ -294,320 +397,470 @@ class DeepLExtension(Extension):
                 on_alt_enter=ExtensionCustomAction(translate_data | {'target_lang': lang},
                                                    keep_app_open=True) if select_source_lang else None))
 
-        return RenderResultListAction(items)
-
-    def on_enter(self, data):
-        if 'reset' in data:
-            return self.on_input(data['keyword'], data['reset'])
-
-        languages_per_page_str = str(self.preferences['languages_per_page'])
-        languages_per_page = int(languages_per_page_str) if languages_per_page_str.isnumeric() else 10
-
-        if 'action' in data:
-            if data['action'] == 'source_languages':
-                languages = self.get_source_languages()
-            elif data['action'] == 'target_languages':
-                languages = self.get_target_languages()
-            else:
-                return RenderResultListAction([
-                    ExtensionResultItem(icon='images/icon.png',
-                                        name='An error occured',
-                                        highlightable=False,
-                                        on_enter=HideWindowAction())
-                ])
-
-            page = data['page'] if 'page' in data else 1
-            total_page_count = math.ceil((len(languages) + 1) / languages_per_page)
-
-            items = []
-            if total_page_count > 1:
-                page_descriptions = []
-                next_page, previous_page = page < total_page_count, page > 1
-                if next_page:
-                    page_descriptions.append('Enter for next page')
-                if previous_page:
-                    page_descriptions.append('Alt+Enter for previous page')
-
-                page_data = data.copy()
-                page_data['page'] = page + 1
-                page_alt_data = data.copy()
-                page_alt_data['page'] = page - 1
+        if len(quick_target_languages) > 1:
+            items.append(ExtensionResultItem(
+                icon='images/icon.png',
+                name='Translate to all of them',
+                description='Alt+Enter to choose source language.' if select_source_lang else '',
+                highlightable=False,
+                on_enter=ExtensionCustomAction(translate_data | {'source_lang': source_lang,
+                                                                 'target_langs': quick_target_languages},
+                                               keep_app_open=True),
+                on_alt_enter=ExtensionCustomAction(translate_data | {'target_langs': quick_target_languages},
+                                                   keep_app_open=True) if select_source_lang else None))
 
-                items.append(
-                    ExtensionResultItem(
-                        icon='images/icon.png',
-                        name=f'Page {page}/{total_page_count}',
-                        description=', '.join(page_descriptions),
-                        highlightable=False,
-                        on_enter=ExtensionCustomAction(page_data, keep_app_open=True) if next_page else None,
-                        on_alt_enter=ExtensionCustomAction(page_alt_data,
-                                                           keep_app_open=True) if previous_page else None)
-                )
+        return RenderResultListAction(items)
 
-            for i in range((page - 1) * languages_per_page, min(len(languages), page * languages_per_page)):
-                language = languages[i]
-                items.append(ExtensionResultItem(icon='images/icon.png',
-                                                 name=f'{language.code}: {language.name}',
-                                                 highlightable=False,
-                                                 on_enter=HideWindowAction()))
+    def on_input_document(self, keyword, query):
+        path = Path(query.text[5:].strip()).expanduser()
+        if not path.is_file() or path.suffix.lower() not in DOCUMENT_TYPES:
+            return RenderResultListAction([
+                ExtensionResultItem(icon='images/icon.png',
+                                    name=f'File "{path}" not found' if not path.is_file()
+                                    else f'{path.suffix or "This file type"} can\'t be translated',
+                                    description=f'Supported file types: {", ".join(DOCUMENT_TYPES)}',
+                                    highlightable=False,
+                                    on_enter=DoNothingAction())
+            ])
 
-            return RenderResultListAction(items)
+        target_langs = query.target_langs
+        if not target_langs:
+            quick_access_languages = to_int(self.preferences['quick_access_languages'], 3)
+            target_langs = self.engine.get_last_target_languages()[:quick_access_languages]
+        if not target_langs:
+            return RenderResultListAction([
+                ExtensionResultItem(icon='images/icon.png',
+                                    name='Choose a target language',
+                                    description=f'For example: {keyword} auto:de file:{path}',
+                                    highlightable=False,
+                                    on_enter=DoNothingAction())
+            ])
 
-        def compare(last_languages, lang1, lang2):
-            l1, l2 = lang1.code, lang2.code
-            e1, e2 = l1 in last_languages, l2 in last_languages
-            if not e1 and not e2:
-                return 0
-            if e1 and not e2:
-                return -1
-            if not e1 and e2:
-                return 1
-            return last_languages.index(l1) - last_languages.index(l2)
+        items = []
+        for target_lang in target_langs:
+            data = {'keyword': keyword, 'action': 'document', 'path': str(path), 'source_lang': query.source_lang,
+                    'target_lang': target_lang}
+            job = self.engine.documents.get_job(path, target_lang)
+            if job:
+                items.append(self.document_item(job, data))
+                continue
+
+            output_path = self.engine.documents.get_output_path(path, target_lang)
+            budget_warning = self.get_budget_warning(estimate_characters(path))
+            items.append(ExtensionResultItem(icon='images/icon.png',
+                                             name=f'Translate {path.name} to '
+                                                  f'{self.engine.get_target_language_name(target_lang)}',
+                                             description=f'The translation is saved as {output_path.name}.'
+                                                         + (f'\n{budget_warning}' if budget_warning else ''),
+                                             highlightable=False,
+                                             on_enter=ExtensionCustomAction(data, keep_app_open=True)))
+        return RenderResultListAction(items)
 
-        last_source_languages = self.get_last_source_languages()
-        last_target_languages = self.get_last_target_languages()
+    def document_item(self, job, data):
+        target_name = self.engine.get_target_language_name(job.target_lang)
+        if job.status == 'done':
+            return ExtensionResultItem(icon='images/icon.png',
+                                       name=f'Translated {job.input_path.name} to {target_name}'
+                                            + (' (cached)' if job.cached else ''),
+                                       description=f'{job.output_path}\nEnter to open the translation, '
+                                                   f'Alt+Enter to copy its path.',
+                                       highlightable=False,
+                                       on_enter=OpenAction(str(job.output_path)),
+                                       on_alt_enter=CopyToClipboardAction(str(job.output_path)))
+        if job.status == 'error':
+            return ExtensionResultItem(icon='images/icon.png',
+                                       name=f'Could not translate {job.input_path.name} to {target_name}',
+                                       description=f'{job.error}\nPress Enter to try again.',
+                                       highlightable=False,
+                                       on_enter=ExtensionCustomAction(data | {'action': 'document'},
+                                                                      keep_app_open=True))
+
+        remaining = f', about {job.seconds_remaining} s left' if job.seconds_remaining else ''
+        return ExtensionResultItem(icon='images/icon.png',
+                                   name=f'Translating {job.input_path.name} to {target_name}: {job.status}{remaining}',
+                                   description='Press Enter to refresh.',
+                                   highlightable=False,
+                                   on_enter=ExtensionCustomAction(data | {'action': 'document_status'},
+                                                                  keep_app_open=True))
+
+    def on_enter_document(self, data):
+        path = Path(data['path'])
+        job = self.engine.documents.get_job(path, data['target_lang'])
+        if data['action'] == 'document' or not job:
+            # Documents are the largest single charges, so they always need a confirmation close to the quota.
+            characters = estimate_characters(path) if path.is_file() else 0
+            if not data.get('budget_confirmed') and self.engine.budget.check(characters):
+                return RenderResultListAction([self.budget_confirm_item(data | {'action': 'document'}, characters)])
+            job = self.engine.translate_document(path, data['source_lang'], data['target_lang'])
+        # Give quick jobs, like documents that were translated before, the chance to finish before rendering.
+        job.finished.wait(DOCUMENT_WAIT)
+        return RenderResultListAction([self.document_item(job, data)])
+
+    def on_input_language_search(self, keyword, match):
+        source, targets, query = match['source'], match['targets'], match['query']
+        source_valid = not source or source.upper() in ('SELECT', 'AUTO') or self.engine.get_source_language(source)
+        languages_per_page = to_int(self.preferences['languages_per_page'], 10)
+
+        if not source_valid and not targets and not query:
+            languages = self.engine.languages.search('source', source)[:languages_per_page]
+            items = [ExtensionResultItem(icon='images/icon.png',
+                                         name=f'Translate from {language.name}',
+                                         description=f'{language.code} - Enter to choose the target language.',
+                                         highlightable=False,
+                                         on_enter=SetUserQueryAction(f'{keyword} {language.code}:'))
+                     for language in languages]
+        elif source_valid:
+            languages = self.engine.languages.search('target', query)[:languages_per_page]
+            items = [ExtensionResultItem(icon='images/icon.png',
+                                         name=f'Translate to {language.name}',
+                                         description=f'{language.code} - Alt+Enter to add another target language.',
+                                         highlightable=False,
+                                         on_enter=SetUserQueryAction(f'{keyword} {source}:{targets}{language.code} '),
+                                         on_alt_enter=SetUserQueryAction(
+                                             f'{keyword} {source}:{targets}{language.code},'))
+                     for language in languages]
+        else:
+            return None
 
-        if 'source_lang' not in data:
-            last_target = last_target_languages[0] if last_target_languages else None
-            last_target_name = self.get_target_language_name(last_target) if last_target else None
+        return RenderResultListAction(items) if items else None
 
-            languages = sorted(self.get_source_languages(),
-                               key=cmp_to_key(lambda lang1, lang2: compare(last_source_languages, lang1, lang2)))
-            description = f'Alt+Enter to translate to {last_target_name}.' if last_target and 'target_lang' not in \
-                                                                              data else ''
+    def render_language_page(self, picker, data, languages, version, render_language, first_items=()):
+        languages_per_page = to_int(self.preferences['languages_per_page'], 10)
 
-            page = data['page'] if 'page' in data else 1
-            total_page_count = math.ceil((len(languages) + 1) / languages_per_page)
+        page = data['page'] if 'page' in data else 1
+        base_data = {key: value for key, value in data.items() if key != 'page'}
+        # An id can be reused once a refresh frees the old list, so the version of the fetched languages is added.
+        key = (picker, self.engine.languages.version, id(languages), version, languages_per_page,
+               json.dumps(base_data, sort_keys=True))
+        view = PageView(languages, languages_per_page, len(first_items))
 
+        def render(page):
             items = []
-            if total_page_count > 1:
+            if view.total_page_count > 1:
                 page_descriptions = []
-                next_page, previous_page = page < total_page_count, page > 1
+                next_page, previous_page = page < view.total_page_count, page > 1
                 if next_page:
                     page_descriptions.append('Enter for next page')
                 if previous_page:
                     page_descriptions.append('Alt+Enter for previous page')
 
-                page_data = data.copy()
-                page_data['page'] = page + 1
-                page_alt_data = data.copy()
-                page_alt_data['page'] = page - 1
-
                 items.append(
                     ExtensionResultItem(
                         icon='images/icon.png',
-                        name=f'Page {page}/{total_page_count}',
+                        name=f'Page {page}/{view.total_page_count}',
                         description=', '.join(page_descriptions),
                         highlightable=False,
-                        on_enter=ExtensionCustomAction(page_data, keep_app_open=True) if next_page else None,
-                        on_alt_enter=ExtensionCustomAction(page_alt_data,
+                        on_enter=ExtensionCustomAction(base_data | {'page': page + 1},
+                                                       keep_app_open=True) if next_page else None,
+                        on_alt_enter=ExtensionCustomAction(base_data | {'page': page - 1},
                                                            keep_app_open=True) if previous_page else None)
                 )
 
             if page == 1:
-                detect_data = data.copy()
-                if 'page' in detect_data:
-                    del detect_data['page']
-                detect_data['source_lang'] = None
-                detect_alt_data = detect_data.copy()
-                if last_target and 'target_lang' not in data:
-                    detect_alt_data['target_lang'] = last_target
-                items.append(
-                    ExtensionResultItem(icon='images/icon.png',
-                                        name='Detect language',
-                                        description=description,
-                                        highlightable=False,
-                                        on_enter=ExtensionCustomAction(detect_data, keep_app_open=True),
-                                        on_alt_enter=ExtensionCustomAction(detect_alt_data, keep_app_open=True))
-                )
+                items.extend(first_items)
+            items.extend(render_language(language) for language in view.slice(page))
+            return items
 
-            for i in range((page - 1) * languages_per_page - (1 if page != 1 else 0),
-                           min(len(languages), page * languages_per_page - 1)):
-                language = languages[i]
-
-                new_data = data.copy()
-                if 'page' in new_data:
-                    del new_data['page']
-                new_data['source_lang'] = language.code
-                new_alt_data = new_data.copy()
-                if last_target and 'target_lang' not in data:
-                    new_alt_data['target_lang'] = last_target
-                items.append(ExtensionResultItem(icon='images/icon.png',
-                                                 name=f'Translate from {language.name}',
-                                                 description=description,
-                                                 highlightable=False,
-                                                 on_enter=ExtensionCustomAction(new_data, keep_app_open=True),
-                                                 on_alt_enter=ExtensionCustomAction(new_alt_data, keep_app_open=True)))
-
-            return RenderResultListAction(items)
-        elif data['source_lang']:
-            self.set_last_source_language(data['source_lang'])
-
-        if 'target_lang' not in data:
-            languages = sorted(self.get_target_languages(),
-                               key=cmp_to_key(lambda lang1, lang2: compare(last_target_languages, lang1, lang2)))
+        items = self.page_cache.get(key, page, render)
+        self.page_cache.prefetch(key, [adjacent for adjacent in (page - 1, page + 1)
+                                       if 1 <= adjacent <= view.total_page_count], render)
+        return RenderResultListAction(items)
 
-            page = data['page'] if 'page' in data else 1
-            total_page_count = math.ceil((len(languages) + 1) / languages_per_page)
+    def on_enter(self, data):
+        self.engine.loaded.wait()
+        if self.engine.load_error:
+            return self.load_error_result()
 
-            items = []
-            if total_page_count > 1:
-                page_descriptions = []
-                next_page, previous_page = page < total_page_count, page > 1
-                if next_page:
-                    page_descriptions.append('Enter for next page')
-                if previous_page:
-                    page_descriptions.append('Alt+Enter for previous page')
+        from deepl import DeepLException
 
-                page_data = data.copy()
-                page_data['page'] = page + 1
-                page_alt_data = data.copy()
-                page_alt_data['page'] = page - 1
+        if 'reset' in data:
+            return self.on_input(data['keyword'], data['reset'])
 
-                items.append(
-                    ExtensionResultItem(
-                        icon='images/icon.png',
-                        name=f'Page {page}/{total_page_count}',
-                        description=', '.join(page_descriptions),
-                        highlightable=False,
-                        on_enter=ExtensionCustomAction(page_data, keep_app_open=True) if next_page else None,
-                        on_alt_enter=ExtensionCustomAction(page_alt_data,
-                                                           keep_app_open=True) if previous_page else None)
-                )
+        if data.get('action') in ('document', 'document_status'):
+            return self.on_enter_document(data)
 
-            for i in range((page - 1) * languages_per_page, min(len(languages), page * languages_per_page)):
-                language = languages[i]
+        if data.get('result_id') in self.results:
+            return self.render_result(data, self.results[data['result_id']])
 
-                new_data = data.copy()
-                if 'page' in new_data:
-                    del new_data['page']
-                new_data['target_lang'] = language.code
-                items.append(ExtensionResultItem(icon='images/icon.png',
-                                                 name=f'Translate to {language.name}',
-                                                 highlightable=False,
-                                                 on_enter=ExtensionCustomAction(new_data, keep_app_open=True)))
+        if 'action' in data:
+            try:
+                if data['action'] == 'source_languages':
+                    languages = self.engine.get_source_languages()
+                elif data['action'] == 'target_languages':
+                    languages = self.engine.get_target_languages()
+                else:
+                    return RenderResultListAction([
+                        ExtensionResultItem(icon='images/icon.png',
+                                            name='An error occured',
+                                            highlightable=False,
+                                            on_enter=HideWindowAction())
+                    ])
+            except DeepLException as error:
+                return self.error_result(error)
+
+            return self.render_language_page(
+                data['action'], data, languages, 0,
+                lambda language: ExtensionResultItem(icon='images/icon.png',
+                                                     name=f'{language.code}: {language.name}',
+                                                     highlightable=False,
+                                                     on_enter=HideWindowAction()))
+
+        last_target_languages = self.engine.get_last_target_languages()
 
-            return RenderResultListAction(items)
-        if data['target_lang']:
-            self.set_last_target_language(data['target_lang'])
+        if 'source_lang' not in data:
+            last_target = last_target_languages[0] if last_target_languages and 'target_lang' not in data else None
+            try:
+                languages = self.engine.source_ranking.sort(self.engine.get_source_languages())
+                description = f'Alt+Enter to translate to {self.engine.get_target_language_name(last_target)}.' \
+                    if last_target else ''
+            except DeepLException as error:
+                return self.error_result(error)
+            base_data = {key: value for key, value in data.items() if key != 'page'}
+
+            def render_source_language(language):
+                new_data = base_data | {'source_lang': language.code}
+                return ExtensionResultItem(icon='images/icon.png',
+                                           name=f'Translate from {language.name}',
+                                           description=description,
+                                           highlightable=False,
+                                           on_enter=ExtensionCustomAction(new_data, keep_app_open=True),
+                                           on_alt_enter=ExtensionCustomAction(
+                                               new_data | {'target_lang': last_target} if last_target else new_data,
+                                               keep_app_open=True))
+
+            detect_data = base_data | {'source_lang': None}
+            detect_item = ExtensionResultItem(icon='images/icon.png',
+                                              name='Detect language',
+                                              description=description,
+                                              highlightable=False,
+                                              on_enter=ExtensionCustomAction(detect_data, keep_app_open=True),
+                                              on_alt_enter=ExtensionCustomAction(
+                                                  detect_data | {'target_lang': last_target} if last_target
+                                                  else detect_data, keep_app_open=True))
+
+            # The items offer Alt+Enter to the last target language, so the pages depend on it as well.
+            return self.render_language_page('source', data, languages,
+                                             (self.engine.source_ranking.version, last_target),
+                                             render_source_language, [detect_item])
+
+        if 'target_langs' in data:
+            return self.on_enter_fan_out(data)
 
+        if 'target_lang' not in data:
+            try:
+                languages = self.engine.target_ranking.sort(self.engine.get_target_languages())
+            except DeepLException as error:
+                return self.error_result(error)
+            base_data = {key: value for key, value in data.items() if key != 'page'}
+            return self.render_language_page(
+                'target', data, languages, self.engine.target_ranking.version,
+                lambda language: ExtensionResultItem(icon='images/icon.png',
+                                                     name=f'Translate to {language.name}',
+                                                     highlightable=False,
+                                                     on_enter=ExtensionCustomAction(
+                                                         base_data | {'target_lang': language.code},
+                                                         keep_app_open=True)))
         if 'translate_directly' in data and not data['translate_directly']:
             new_data = data.copy()
             new_data['translate_directly'] = True
 
             source_lang = data['source_lang']
             target_lang = data['target_lang']
-            return RenderResultListAction([
+            if data.get('no_cache'):
+                self.engine.speculative.cancel()
+            else:
+                self.engine.translate_speculatively(data['text'].strip(), source_lang, target_lang)
+            return RenderResultListAction(self.get_memory_items(data['text'], target_lang) + [
                 ExtensionResultItem(icon='images/icon.png',
                                     name=f'Translate ' +
-                                         (f'from {self.get_source_language_name(source_lang)} ' if source_lang else '')
-                                         + f'to {self.get_target_language_name(target_lang)}',
+                                         (f'from {self.engine.get_source_language_name(source_lang)} '
+                                          if source_lang else '')
+                                         + f'to {self.engine.get_target_language_name(target_lang)}',
+                                    description=self.get_budget_warning(
+                                        self.get_billable_characters(data, [target_lang])) or '',
                                     highlightable=False,
                                     on_enter=ExtensionCustomAction(new_data, keep_app_open=True))
             ])
 
+        budget_item = self.get_budget_item(data, [data['target_lang']])
+        if budget_item:
+            return RenderResultListAction([budget_item])
+
         try:
-            supports_formality = False
-            for language in self.get_target_languages():
-                if language.code == data['target_lang']:
-                    supports_formality = language.supports_formality
-            if supports_formality:
-                try:
-                    formality = Formality[self.preferences['formality'].upper()]
-                except KeyError:
-                    formality = Formality.DEFAULT
-            else:
-                formality = Formality.DEFAULT
-
-            result = self.translator.translate_text(data['text'].strip(),
-                                                    source_lang=data['source_lang'],
-                                                    target_lang=data['target_lang'],
-                                                    formality=formality)
-            source_lang, target_lang = data['source_lang'] or result.detected_source_lang, data['target_lang']
-
-            split_result = str(self.preferences['split_result'])
-            shown_text = None
-            if split_result.isnumeric():
-                split_result_int = int(split_result)
-                if split_result_int is not 0:
-                    parts, current = [], None
-                    for word in result.text.split(' '):
-                        new_current = f'{current} {word}' if current else word
-                        if not current or len(new_current) <= split_result_int:
-                            current = new_current
-                        else:
-                            parts.append(current)
-                            current = word
-                    parts.append(current)
-                    shown_text = '\n'.join(parts)
-            if not shown_text:
-                shown_text = result.text
-
-            keyword = data['keyword']
-            return RenderResultListAction([
-                ExtensionResultItem(icon='images/icon.png',
-                                    name=f'Translation: {self.get_source_language_name(source_lang)} \u27A1 '
-                                         f'{self.get_target_language_name(target_lang)}',
-                                    description=shown_text,
-                                    highlightable=False,
-                                    on_enter=CopyToClipboardAction(result.text),
-                                    on_alt_enter=ExtensionCustomAction({'reset': result.text,
-                                                                        'keyword': keyword}, keep_app_open=True)
-                                    if data['text'] == result.text else SetUserQueryAction(
-                                        f'{keyword} {target_lang.lower().split("-")[0]}:select {result.text}')),
-                ExtensionResultItem(icon='images/icon.png',
-                                    name='Actions',
-                                    description='Enter on the result item to copy the result.'
-                                                '\nAlt+Enter on the result item to translate the result into another '
-                                                'language.'
-                                                '\nEnter on this item to translate again and reset the input text.'
-                                                '\nAlt+Enter on this item to translate again and keep the input text.',
-                                    highlightable=False,
-                                    on_enter=SetUserQueryAction(f'{keyword} '),
-                                    on_alt_enter=ExtensionCustomAction({'reset': data['original_text'],
-                                                                        'keyword': keyword},
-                                                                       keep_app_open=True))
-            ])
+            future = self.engine.executor.submit(self.engine.translate, data['text'].strip(), data['source_lang'],
+                                                 data['target_lang'], data.get('no_cache', False))
+            try:
+                result = future.result(timeout=self.latency_budget)
+            except TimeoutError:
+                return RenderResultListAction([self.still_working_item(data | {'no_cache': False})])
+            return self.render_result(data, result)
         except DeepLException as error:
-            LOGGER.error(error)
+            return self.error_result(error)
+
+    def render_result(self, data, result):
+        source_lang, target_lang = data['source_lang'] or result.detected_source_lang, data['target_lang']
+        page = data.get('result_page', 0)
+        if not page:
+            # Only translations count as using the languages, not paging through pickers or results.
+            if data['source_lang']:
+                self.engine.set_last_source_language(data['source_lang'])
+            self.engine.set_last_target_language(target_lang)
+            self.engine.record_translation(source_lang, target_lang, data['text'].strip(), result.text)
+
+        with self.stats.span('on_enter.wrap_result'):
+            shown_text, more = self.wrap_result(result.text, page)
+
+        keyword = data['keyword']
+        more_items = []
+        if more:
+            # The result is kept, so paging through it neither needs the cache nor another request.
+            result_id = data['result_id'] if data.get('result_id') in self.results else self.keep_result(result)
+            more_items.append(self.show_more_item(data, page + 1, result_id))
+        return RenderResultListAction([
+            ExtensionResultItem(icon='images/icon.png',
+                                name=f'Translation: {self.engine.get_source_language_name(source_lang)} \u27A1 '
+                                     f'{self.engine.get_target_language_name(target_lang)}'
+                                     + (f' (page {page + 1})' if page else '')
+                                     + (' (cached)' if getattr(result, 'cached', False) else ''),
+                                description=shown_text,
+                                highlightable=False,
+                                on_enter=CopyToClipboardAction(result.text),
+                                on_alt_enter=ExtensionCustomAction({'reset': result.text,
+                                                                    'keyword': keyword}, keep_app_open=True)
+                                if data['text'] == result.text else SetUserQueryAction(
+                                    f'{keyword} {target_lang.lower().split("-")[0]}:select {result.text}')),
+            *more_items,
+            ExtensionResultItem(icon='images/icon.png',
+                                name='Actions',
+                                description='Enter on the result item to copy the result.'
+                                            '\nAlt+Enter on the result item to translate the result into another '
+                                            'language.'
+                                            '\nEnter on this item to translate again and reset the input text.'
+                                            '\nAlt+Enter on this item to translate again and keep the input text.',
+                                highlightable=False,
+                                on_enter=SetUserQueryAction(f'{keyword} '),
+                                on_alt_enter=ExtensionCustomAction({'reset': data['original_text'],
+                                                                    'keyword': keyword},
+                                                                   keep_app_open=True))
+        ])
+
+    def on_enter_fan_out(self, data):
+        target_langs = data['target_langs']
+        if data.get('translate_directly') is False:
+            new_data = data.copy()
+            new_data['translate_directly'] = True
+
+            source_lang = data['source_lang']
             return RenderResultListAction([
                 ExtensionResultItem(icon='images/icon.png',
-                                    name='An error occured',
+                                    name='Translate ' +
+                                         (f'from {self.engine.get_source_language_name(source_lang)} '
+                                          if source_lang else '')
+                                         + 'to ' + ', '.join(self.engine.get_target_language_name(target_lang)
+                                                             for target_lang in target_langs),
+                                    description=self.get_budget_warning(
+                                        self.get_billable_characters(data, target_langs)) or '',
                                     highlightable=False,
-                                    on_enter=HideWindowAction())
+                                    on_enter=ExtensionCustomAction(new_data, keep_app_open=True))
             ])
 
+        budget_item = self.get_budget_item(data, target_langs)
+        if budget_item:
+            return RenderResultListAction([budget_item])
+
+        # Checking on slow translations doesn't count as using the languages again.
+        if not data.get('retry'):
+            if data['source_lang']:
+                self.engine.set_last_source_language(data['source_lang'])
+            for target_lang in reversed(target_langs):
+                self.engine.set_last_target_language(target_lang)
+
+        text = data['text'].strip()
+        futures = [self.engine.executor.submit(self.engine.translate, text, data['source_lang'], target_lang,
+                                               data.get('no_cache', False))
+                   for target_lang in target_langs]
+
+        wait(futures, timeout=self.latency_budget)
+
+        keyword = data['keyword']
+        items = []
+        for target_lang, future in zip(target_langs, futures):
+            target_name = self.engine.get_target_language_name(target_lang)
+            if not future.done():
+                items.append(self.still_working_item(data | {'no_cache': False, 'retry': True},
+                                                     f'Still translating to {target_name}...'))
+                continue
+
+            try:
+                result = future.result()
+            except Exception as error:
+                LOGGER.error(error)
+                items.append(ExtensionResultItem(icon='images/icon.png',
+                                                 name=f'Translation to {target_name} failed',
+                                                 description=str(error),
+                                                 highlightable=False,
+                                                 on_enter=DoNothingAction()))
+                continue
+
+            source_lang = data['source_lang'] or result.detected_source_lang
+            self.engine.record_translation(source_lang, target_lang, text, result.text)
+            shown_text, more = self.wrap_result(result.text)
+            items.append(ExtensionResultItem(icon='images/icon.png',
+                                             name=f'Translation: {self.engine.get_source_language_name(source_lang)} '
+                                                  f'\u27A1 {target_name}'
+                                                  + (' (cached)' if getattr(result, 'cached', False) else ''),
+                                             description=shown_text,
+                                             highlightable=False,
+                                             on_enter=CopyToClipboardAction(result.text),
+                                             on_alt_enter=SetUserQueryAction(
+                                                 f'{keyword} {target_lang.lower().split("-")[0]}:select '
+                                                 f'{result.text}')))
+            if more:
+                single_data = {key: value for key, value in data.items() if key != 'target_langs'}
+                items.append(self.show_more_item(single_data | {'target_lang': target_lang}, 1,
+                                                 self.keep_result(result),
+                                                 f'Show more of the translation to {target_name}'))
+        return RenderResultListAction(items)
+
 
 class SystemExitEventListener(EventListener):
 
     def on_event(self, event: SystemExitEvent, extension: DeepLExtension):
-        json.dump(extension.data, extension.data_file.open('w'))
+        extension.engine.close()
 
 
 class PreferencesEventListener(EventListener):
 
     def on_event(self, event: PreferencesEvent, extension: DeepLExtension):
-        api_key = event.preferences['api_key']
-        extension.translator = Translator(api_key) if api_key else None
+        for preference_id, value in event.preferences.items():
+            extension.apply_preference(preference_id, value)
+        extension.engine.usage_poller.start()
 
 
 class PreferencesUpdateEventListener(EventListener):
 
     def on_event(self, event: PreferencesUpdateEvent, extension: DeepLExtension):
+        extension.apply_preference(event.id, event.new_value)
         if event.id == 'api_key':
-            extension.translator = Translator(event.new_value) if event.new_value else None
+            extension.engine.usage_poller.reset()
 
 
 class KeywordQueryEventListener(EventListener):
 
     def on_event(self, event: KeywordQueryEvent, extension: DeepLExtension):
-        return extension.on_input(event.get_keyword(), event.get_argument())
+        generation = extension.next_generation()
+        with extension.stats.span('on_input'):
+            action = extension.on_input(event.get_keyword(), event.get_argument())
+        return action if generation == extension.generation else None
 
 
 class ItemEnterListener(EventListener):
 
     def on_event(self, event: ItemEnterEvent, extension: DeepLExtension):
-        return extension.on_enter(event.get_data())
+        generation = extension.next_generation()
+        with extension.stats.span('on_enter'):
+            action = extension.on_enter(event.get_data())
+        return action if generation == extension.generation else None
 
 
 if __name__ == '__main__':
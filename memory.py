@@ -0,0 +1,136 @@
+import math
+import re
+import threading
+from array import array
+from collections import Counter
+
+PUNCTUATION = re.compile(r'[^\w\s]+')
+WHITESPACE = re.compile(r'\s+')
+
+PROBE_BUDGET = 20000
+
+
+def normalize(text):
+    return WHITESPACE.sub(' ', PUNCTUATION.sub(' ', text.lower())).strip()
+
+
+def trigrams(text):
+    text = f' {text} '
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class MemoryEntry:
+    __slots__ = ('source_lang', 'target_lang', 'text', 'result', 'grams')
+
+    def __init__(self, source_lang, target_lang, text, result, grams):
+        self.source_lang = source_lang
+        self.target_lang = target_lang
+        self.text = text
+        self.result = result
+        self.grams = grams
+
+
+class TranslationMemory:
+
+    def __init__(self, threshold=0.6, max_entries=50000):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.keys = {}
+        # Trigrams are stored as ids in compact arrays; sets of strings took about 11 kB per entry.
+        self.gram_ids = {}
+        self.index = {}
+        self.stale = {}
+        self.next_id = 0
+
+    def load(self, rows):
+        for source_lang, target_lang, text, result in rows:
+            self.add(source_lang, target_lang, text, result)
+
+    def add(self, source_lang, target_lang, text, result):
+        normalized = normalize(text)
+        if not normalized:
+            return
+
+        key = (source_lang, target_lang, normalized)
+        with self.lock:
+            if key in self.keys:
+                self.remove(self.keys[key])
+
+            entry_id = self.next_id
+            self.next_id += 1
+            grams = array('I', sorted(self.gram_ids.setdefault(gram, len(self.gram_ids))
+                                      for gram in trigrams(normalized)))
+            self.entries[entry_id] = MemoryEntry(source_lang, target_lang, text, result, grams)
+            self.keys[key] = entry_id
+            for gram_id in grams:
+                postings = self.index.get(gram_id)
+                if postings is None:
+                    postings = self.index[gram_id] = array('I')
+                postings.append(entry_id)
+
+            while len(self.entries) > self.max_entries:
+                self.remove(next(iter(self.entries)))
+
+    def remove(self, entry_id):
+        entry = self.entries.pop(entry_id)
+        del self.keys[(entry.source_lang, entry.target_lang, normalize(entry.text))]
+        # Removed entries stay in a posting list until they make up half of it, then only that list is rebuilt.
+        for gram_id in entry.grams:
+            stale = self.stale.pop(gram_id, 0) + 1
+            postings = self.index[gram_id]
+            if stale * 2 <= len(postings):
+                self.stale[gram_id] = stale
+                continue
+            postings = array('I', (posting for posting in postings if posting in self.entries))
+            if postings:
+                self.index[gram_id] = postings
+            else:
+                del self.index[gram_id]
+
+    def search(self, text, target_lang=None, limit=3):
+        normalized = normalize(text)
+        if not normalized:
+            return []
+
+        grams = trigrams(normalized)
+        # The epsilon keeps rounding errors from pushing an exact bound (e.g. 0.6 * 7 / 1.4) to the next integer.
+        min_overlap = math.ceil(self.threshold * len(grams) / (2 - self.threshold) - 1e-9)
+        with self.lock:
+            # Every match shares at least min_overlap trigrams with the query, so it has to occur in one of the
+            # len(grams) - min_overlap + 1 rarest posting lists. Probing more of them while they are cheap raises
+            # the number of shared trigrams a candidate needs before it is verified. If even the required lists
+            # are large, all lists are counted so no candidate has to be verified.
+            gram_ids = {self.gram_ids.get(gram) for gram in grams} - {None}
+            postings = sorted((self.index.get(self.gram_ids.get(gram), ()) for gram in grams), key=len)
+            probed = len(grams) - min_overlap + 1
+            probed_size = sum(map(len, postings[:probed]))
+            if probed_size > PROBE_BUDGET:
+                probed = len(postings)
+            while probed < len(postings) and probed_size + len(postings[probed]) <= PROBE_BUDGET:
+                probed_size += len(postings[probed])
+                probed += 1
+
+            overlaps = Counter()
+            for entry_ids in postings[:probed]:
+                overlaps.update(entry_ids)
+
+            required = min_overlap - (len(grams) - probed)
+            matches = []
+            for entry_id, overlap in overlaps.items():
+                if overlap < required:
+                    continue
+                entry = self.entries.get(entry_id)
+                if entry is None:
+                    continue
+                if target_lang and entry.target_lang != target_lang:
+                    continue
+                if probed < len(grams):
+                    overlap = sum(gram_id in gram_ids for gram_id in entry.grams)
+                score = 2 * overlap / (len(grams) + len(entry.grams))
+                if score >= self.threshold:
+                    matches.append((score, entry_id, entry))
+
+        matches.sort(key=lambda match: (match[0], match[1]), reverse=True)
+        return [(score, entry) for score, _, entry in matches[:limit]]
@@ -0,0 +1,49 @@
+import math
+import threading
+from collections import OrderedDict
+
+
+class PageView:
+
+    def __init__(self, languages, per_page, leading=0):
+        self.languages = languages
+        self.per_page = per_page
+        self.leading = leading
+        self.total_page_count = math.ceil((len(languages) + 1) / per_page)
+
+    def slice(self, page):
+        start = (page - 1) * self.per_page - (self.leading if page != 1 else 0)
+        return self.languages[max(start, 0):page * self.per_page - self.leading]
+
+
+class PageCache:
+
+    def __init__(self, executor, max_pages=64):
+        self.executor = executor
+        self.max_pages = max_pages
+        self.lock = threading.Lock()
+        self.pages = OrderedDict()
+
+    def get(self, key, page, render):
+        with self.lock:
+            items = self.pages.get((key, page))
+            if items is not None:
+                self.pages.move_to_end((key, page))
+                return items
+
+        items = render(page)
+        self.put(key, page, items)
+        return items
+
+    def put(self, key, page, items):
+        with self.lock:
+            self.pages[(key, page)] = items
+            self.pages.move_to_end((key, page))
+            while len(self.pages) > self.max_pages:
+                self.pages.popitem(last=False)
+
+    def prefetch(self, key, pages, render):
+        with self.lock:
+            missing = [page for page in pages if (key, page) not in self.pages]
+        for page in missing:
+            self.executor.submit(lambda page=page: self.put(key, page, render(page)))
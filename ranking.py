@@ -0,0 +1,43 @@
+import math
+import time
+
+
+class FrecencyRanking:
+
+    def __init__(self, entries, half_life=7 * 24 * 3600, max_entries=50):
+        self.entries = entries
+        self.half_life = half_life
+        self.max_entries = max_entries
+        self.version = 0
+        self.ranked = None
+        self.sorted_languages = (None, None, None)
+
+    def rank_key(self, code):
+        entry = self.entries[code]
+        return math.log2(entry['score']) + entry['last'] / self.half_life
+
+    def record(self, code, now=None):
+        now = now or time.time()
+        entry = self.entries.get(code)
+        score = entry['score'] * 0.5 ** ((now - entry['last']) / self.half_life) if entry else 0
+        self.entries[code] = {'score': score + 1, 'last': now, 'count': entry['count'] + 1 if entry else 1}
+
+        if len(self.entries) > self.max_entries:
+            for old_code in sorted(self.entries, key=self.rank_key)[:len(self.entries) - self.max_entries]:
+                del self.entries[old_code]
+
+        self.version += 1
+        self.ranked = None
+
+    def ranked_codes(self):
+        if self.ranked is None:
+            self.ranked = sorted(self.entries, key=self.rank_key, reverse=True)
+        return self.ranked
+
+    def sort(self, languages):
+        cached_languages, version, result = self.sorted_languages
+        if cached_languages is not languages or version != self.version:
+            rank_map = {code: i for i, code in enumerate(self.ranked_codes())}
+            result = sorted(languages, key=lambda language: rank_map.get(language.code, len(rank_map)))
+            self.sorted_languages = (languages, self.version, result)
+        return result
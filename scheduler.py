@@ -0,0 +1,118 @@
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+LOGGER = logging.getLogger(__name__)
+
+INTERACTIVE = 'interactive'
+BACKGROUND = 'background'
+REFRESH = 'refresh'
+LANES = (INTERACTIVE, BACKGROUND, REFRESH)
+
+MAX_BACKOFF = 30
+
+
+def get_retry_after(response):
+    value = response.headers.get('Retry-After') if response.status_code == 429 else None
+    try:
+        return max(float(value), 0) if value else None
+    except ValueError:
+        return None
+
+
+class ApiScheduler:
+
+    def __init__(self, stats, rate=10.0, burst=10):
+        self.stats = stats
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.blocked_until = 0
+        self.condition = threading.Condition()
+        self.queues = {lane: deque() for lane in LANES}
+        self.local = threading.local()
+
+    @contextmanager
+    def lane(self, lane):
+        previous = getattr(self.local, 'lane', None)
+        self.local.lane = lane
+        try:
+            yield
+        finally:
+            self.local.lane = previous
+
+    def get_lane(self, default):
+        return getattr(self.local, 'lane', None) or default
+
+    def queue_depth(self):
+        with self.condition:
+            return {lane: len(queue) for lane, queue in self.queues.items()}
+
+    def refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, lane):
+        ticket = object()
+        start = time.monotonic()
+        with self.condition:
+            self.queues[lane].append(ticket)
+            try:
+                while True:
+                    now = time.monotonic()
+                    self.refill(now)
+                    # Lanes are served strictly by priority, and in order within a lane.
+                    head = next(queue[0] for queue in self.queues.values() if queue)
+                    if head is ticket and now >= self.blocked_until and self.tokens >= 1:
+                        self.tokens -= 1
+                        break
+
+                    if now < self.blocked_until:
+                        timeout = self.blocked_until - now
+                    elif self.tokens < 1:
+                        timeout = (1 - self.tokens) / self.rate
+                    else:
+                        timeout = None
+                    self.condition.wait(timeout)
+            finally:
+                self.queues[lane].remove(ticket)
+                self.condition.notify_all()
+
+        self.stats.record(f'scheduler.wait.{lane}', (time.monotonic() - start) * 1000)
+
+    def block(self, seconds):
+        with self.condition:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+            self.tokens = 0
+            self.condition.notify_all()
+        self.stats.count('scheduler.throttled')
+
+    def observe(self, response, *args, **kwargs):
+        retry_after = get_retry_after(response)
+        if retry_after is not None:
+            LOGGER.warning(f'DeepL asked to retry after {retry_after} s')
+            self.block(retry_after)
+        return response
+
+    def call(self, lane, fn, retries=1, retry_errors=True):
+        attempt = 0
+        while True:
+            self.acquire(lane)
+            try:
+                return fn()
+            except Exception as error:
+                status = getattr(error, 'http_status_code', None)
+                # A 429 means the request was rejected, so it is always safe to send it again.
+                if attempt >= retries or not (status == 429 or retry_errors and getattr(error, 'should_retry', False)):
+                    raise
+                if status != 429:
+                    time.sleep(min(0.5 * 2 ** attempt, MAX_BACKOFF))
+                elif time.monotonic() >= self.blocked_until:
+                    # DeepL didn't send a Retry-After header, so every lane backs off exponentially.
+                    self.block(min(2 ** attempt, MAX_BACKOFF))
+                attempt += 1
+                self.stats.count('scheduler.retries')
+                LOGGER.info(f'Retrying a DeepL request ({attempt}/{retries}) after: {error}')
@@ -0,0 +1,24 @@
+import re
+
+# Only lines are split, since splitting after periods breaks up abbreviations like "e.g." or "z. B." and DeepL
+# translates sentences better in the context of their paragraph.
+SEGMENT_SEPARATOR = re.compile(r'(\s*\n\s*)')
+
+
+def split_segments(text):
+    segments, layout = [], []
+    for i, token in enumerate(SEGMENT_SEPARATOR.split(text)):
+        if i % 2 or not token.strip():
+            layout.append(token)
+        else:
+            layout.append(len(segments))
+            segments.append(token)
+    return segments, layout
+
+
+def join_segments(layout, translations):
+    return ''.join(translations[part] if isinstance(part, int) else part for part in layout)
+
+
+def unique_segments(segments):
+    return list(dict.fromkeys(segments))
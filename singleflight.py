@@ -0,0 +1,28 @@
+import threading
+from concurrent.futures import Future
+
+
+class SingleFlight:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+
+    def do(self, key, fn):
+        with self.lock:
+            future = self.calls.get(key)
+            leader = future is None
+            if leader:
+                future = self.calls[key] = Future()
+
+        if not leader:
+            return future.result()
+
+        try:
+            future.set_result(fn())
+        except BaseException as error:
+            future.set_exception(error)
+        finally:
+            with self.lock:
+                del self.calls[key]
+        return future.result()
@@ -0,0 +1,67 @@
+import logging
+import threading
+
+LOGGER = logging.getLogger(__name__)
+
+
+class SpeculativeTranslator:
+
+    def __init__(self, delay=0, character_limit=5000):
+        self.delay = delay
+        self.character_limit = character_limit
+        self.characters_used = 0
+        self.lock = threading.Lock()
+        self.generation = 0
+        self.timer = None
+        self.running_key = None
+
+    def enabled(self):
+        return self.delay > 0 and self.characters_used < self.character_limit
+
+    def schedule(self, key, text, translate, store):
+        with self.lock:
+            self.generation += 1
+            generation = self.generation
+            if self.timer:
+                self.timer.cancel()
+                self.timer = None
+            if not self.enabled() or self.characters_used + len(text) > self.character_limit:
+                return
+
+            self.start_timer((generation, key, text, translate, store))
+
+    def start_timer(self, args):
+        self.timer = threading.Timer(self.delay, self.run, args)
+        self.timer.daemon = True
+        self.timer.start()
+
+    def cancel(self):
+        with self.lock:
+            self.generation += 1
+            if self.timer:
+                self.timer.cancel()
+                self.timer = None
+
+    def run(self, generation, key, text, translate, store):
+        with self.lock:
+            if generation != self.generation:
+                return
+            if self.running_key:
+                self.start_timer((generation, key, text, translate, store))
+                return
+            self.running_key = key
+            self.characters_used += len(text)
+
+        try:
+            result = translate()
+            with self.lock:
+                current = generation == self.generation
+            if current:
+                store(result)
+            else:
+                LOGGER.debug('Discarding speculative translation of superseded query')
+        except Exception as error:
+            LOGGER.error(f'Speculative translation failed: {error}')
+        finally:
+            with self.lock:
+                self.running_key = None
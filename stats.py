@@ -0,0 +1,60 @@
+import json
+import logging
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+
+LOGGER = logging.getLogger(__name__)
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    return values[min(len(values) - 1, round(percent / 100 * (len(values) - 1)))]
+
+
+class Stats:
+
+    def __init__(self, log_file, window=1000):
+        self.log_file = log_file
+        self.window = window
+        self.log_enabled = False
+        self.lock = threading.Lock()
+        self.timings = {}
+        self.counters = Counter()
+
+    @contextmanager
+    def span(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, (time.perf_counter() - start) * 1000)
+
+    def record(self, name, duration):
+        with self.lock:
+            if name not in self.timings:
+                self.timings[name] = deque(maxlen=self.window)
+            self.timings[name].append(duration)
+            self.counters[name] += 1
+
+        if self.log_enabled:
+            try:
+                with self.log_file.open('a') as file:
+                    file.write(json.dumps({'time': time.time(), 'span': name, 'ms': round(duration, 3)}) + '\n')
+            except OSError as error:
+                LOGGER.error(f'Could not write "{self.log_file}": {error}')
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.counters[name] += amount
+
+    def summary(self):
+        with self.lock:
+            timings = {name: list(values) for name, values in self.timings.items()}
+            counters = self.counters.copy()
+        return {name: {'count': counters[name],
+                       'p50': percentile(values, 50),
+                       'p95': percentile(values, 95),
+                       'p99': percentile(values, 99)}
+                for name, values in sorted(timings.items())}, counters
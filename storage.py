@@ -0,0 +1,75 @@
+import json
+import logging
+import os
+import threading
+
+LOGGER = logging.getLogger(__name__)
+
+
+def write_atomic(path, content):
+    temp_path = path.with_name(f'{path.name}.tmp')
+    with temp_path.open('w') as file:
+        file.write(content)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_path, path)
+
+    directory = os.open(path.parent, os.O_RDONLY)
+    try:
+        os.fsync(directory)
+    finally:
+        os.close(directory)
+
+
+def read_json(path, default):
+    if not path.exists():
+        return default()
+
+    try:
+        with path.open('r') as file:
+            return json.load(file)
+    except (ValueError, OSError) as error:
+        corrupt_path = path.with_name(f'{path.name}.corrupt')
+        LOGGER.error(f'Could not read "{path}", moving it to "{corrupt_path}": {error}')
+        try:
+            os.replace(path, corrupt_path)
+        except OSError:
+            pass
+        return default()
+
+
+class JsonStore:
+
+    def __init__(self, path, default=dict, delay=1.0):
+        self.path = path
+        self.delay = delay
+        self.lock = threading.RLock()
+        self.write_lock = threading.Lock()
+        self.timer = None
+        self.dirty = False
+        self.data = read_json(path, default)
+
+    def save(self):
+        with self.lock:
+            self.dirty = True
+            if self.timer:
+                return
+            self.timer = threading.Timer(self.delay, self.flush)
+            self.timer.daemon = True
+            self.timer.start()
+
+    def flush(self):
+        with self.lock:
+            if self.timer:
+                self.timer.cancel()
+                self.timer = None
+            if not self.dirty:
+                return
+            self.dirty = False
+            content = json.dumps(self.data, ensure_ascii=False)
+
+        with self.write_lock:
+            try:
+                write_atomic(self.path, content)
+            except OSError as error:
+                LOGGER.error(f'Could not write "{self.path}": {error}')
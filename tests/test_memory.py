@@ -0,0 +1,56 @@
+import random
+import unittest
+from unittest import mock
+
+import memory
+from memory import TranslationMemory, normalize, trigrams
+
+SYLLABLES = ('ka', 'to', 'ri', 'men', 'sa', 'lo', 'un', 'de', 'ber', 'ix')
+
+
+def random_text(rng):
+    return ' '.join(''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(1, 3)))
+                    for _ in range(rng.randint(1, 6)))
+
+
+def brute_force(translation_memory, entry_grams, text, target_lang, limit):
+    grams = trigrams(normalize(text))
+    matches = []
+    for entry_id, entry in translation_memory.entries.items():
+        if target_lang and entry.target_lang != target_lang:
+            continue
+        score = 2 * len(grams & entry_grams[entry_id]) / (len(grams) + len(entry_grams[entry_id]))
+        if score >= translation_memory.threshold:
+            matches.append((score, entry_id, entry))
+    matches.sort(key=lambda match: (match[0], match[1]), reverse=True)
+    return [(score, entry) for score, _, entry in matches[:limit]]
+
+
+class TranslationMemoryTest(unittest.TestCase):
+
+    def test_search_matches_exhaustive_scan(self):
+        rng = random.Random(42)
+        for threshold in (0.3, 0.6, 0.9):
+            # Replacing and evicting entries leaves stale postings behind and compacts the index in between.
+            translation_memory = TranslationMemory(threshold=threshold, max_entries=400)
+            for _ in range(1000):
+                text = random_text(rng)
+                translation_memory.add('EN', rng.choice(('DE', 'FR')), text, text.upper())
+
+            entry_grams = {entry_id: trigrams(normalize(entry.text))
+                           for entry_id, entry in translation_memory.entries.items()}
+            queries = [random_text(rng) for _ in range(100)]
+            queries += [entry.text for entry in list(translation_memory.entries.values())[:20]]
+            # Small budgets force the verification of candidates, large ones counting every posting list.
+            for probe_budget in (0, 50, 1000, memory.PROBE_BUDGET):
+                with mock.patch('memory.PROBE_BUDGET', probe_budget):
+                    for query in queries:
+                        for target_lang in (None, 'DE'):
+                            with self.subTest(threshold=threshold, probe_budget=probe_budget, query=query,
+                                              target_lang=target_lang):
+                                self.assertEqual(translation_memory.search(query, target_lang, 5),
+                                                 brute_force(translation_memory, entry_grams, query, target_lang, 5))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import random
+import unittest
+
+from wrapping import char_width, wrap, wrap_page
+
+WORDS = ('a', 'word', 'longer', 'Grüße', 'München', 'x' * 12, '日本', '東京都', 'テキスト', 'はい。', 'Tokyo駅')
+
+
+def display_width(text):
+    return sum(map(char_width, text))
+
+
+def exhaustive_wrap(text, width):
+    # Tries every break (a run of spaces or the gap next to a wide character) and takes the last one that fits.
+    for line in text.split('\n'):
+        line = line.strip(' ')
+        if not line:
+            yield ''
+            continue
+
+        breaks = []
+        for i in range(1, len(line)):
+            before, char = line[i - 1], line[i]
+            if char == ' ' and before != ' ':
+                space_start = i
+            elif char != ' ' and before == ' ':
+                breaks.append((space_start, i))
+            elif char != ' ' and (char_width(before) == 2 or char_width(char) == 2):
+                breaks.append((i, i))
+        breaks.append((len(line), None))
+
+        start = 0
+        while start is not None:
+            candidates = [(end, next_start) for end, next_start in breaks if end > start]
+            fitting = [candidate for candidate in candidates if display_width(line[start:candidate[0]]) <= width]
+            end, next_start = fitting[-1] if fitting else candidates[0]
+            yield line[start:end]
+            start = next_start
+
+
+def random_text(rng):
+    lines = []
+    for _ in range(rng.randint(1, 4)):
+        words = [rng.choice(WORDS) for _ in range(rng.randint(0, 30))]
+        lines.append(''.join(word + rng.choice(('', ' ', ' ', '  ')) for word in words))
+    return '\n'.join(lines)
+
+
+class WrapTest(unittest.TestCase):
+
+    def test_wrap_matches_exhaustive_search(self):
+        rng = random.Random(7)
+        for _ in range(500):
+            text, width = random_text(rng), rng.randint(1, 40)
+            with self.subTest(text=text, width=width):
+                self.assertEqual(list(wrap(text, width)), list(exhaustive_wrap(text, width)))
+
+    def test_wide_characters(self):
+        self.assertEqual(list(wrap('日本語のテキスト', 6)), ['日本語', 'のテキ', 'スト'])
+        self.assertEqual(list(wrap('Hello 世界 and more', 8)), ['Hello 世', '界 and', 'more'])
+
+    def test_wrap_without_width(self):
+        self.assertEqual(list(wrap('a b c\nd e', 0)), ['a b c', 'd e'])
+
+    def test_wrap_page(self):
+        text = ' '.join(str(i) for i in range(100))
+        lines = list(wrap(text, 10))
+        self.assertEqual(wrap_page(text, 10, 5), ('\n'.join(lines[:5]), True))
+        self.assertEqual(wrap_page(text, 10, 5, 2), ('\n'.join(lines[10:15]), True))
+        last_page = (len(lines) - 1) // 5
+        self.assertEqual(wrap_page(text, 10, 5, last_page), ('\n'.join(lines[last_page * 5:]), False))
+        self.assertEqual(wrap_page(text, 10, 0), ('\n'.join(lines), False))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+import logging
+import threading
+
+LOGGER = logging.getLogger(__name__)
+
+
+class UsagePoller:
+
+    def __init__(self, fetch, error_interval=30):
+        self.fetch = fetch
+        self.error_interval = error_interval
+        self.usage = None
+        self.error = None
+        self.wake = threading.Event()
+        self.thread = None
+
+    def start(self):
+        if self.thread and self.thread.is_alive():
+            return
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def reset(self):
+        self.usage = None
+        self.error = None
+        self.poll_now()
+
+    def poll_now(self):
+        self.wake.set()
+
+    def snapshot(self):
+        return self.usage, self.error
+
+    @staticmethod
+    def get_interval(character):
+        if not character.valid or not character.limit:
+            return 300
+
+        ratio = character.count / character.limit
+        if ratio >= 0.99:
+            return 5
+        if ratio >= 0.9:
+            return 15
+        if ratio >= 0.75:
+            return 60
+        return 300
+
+    def run(self):
+        while True:
+            self.wake.clear()
+            try:
+                usage = self.fetch()
+                if usage:
+                    self.usage, self.error = usage, None
+                interval = self.get_interval(usage.character) if usage else self.error_interval
+            except Exception as error:
+                LOGGER.error(error)
+                self.error = error
+                interval = self.error_interval
+            self.wake.wait(interval)
@@ -0,0 +1,77 @@
+import re
+import unicodedata
+from itertools import islice
+
+WORD_PATTERN = re.compile(r'[^ ]+')
+
+
+def char_width(char):
+    if unicodedata.combining(char):
+        return 0
+    return 2 if unicodedata.east_asian_width(char) in ('W', 'F') else 1
+
+
+def iter_lines(text):
+    start = 0
+    while True:
+        end = text.find('\n', start)
+        if end < 0:
+            yield text[start:]
+            return
+        yield text[start:end]
+        start = end + 1
+
+
+def iter_words(line):
+    if line.isascii():
+        end = 0
+        for match in WORD_PATTERN.finditer(line):
+            yield line[end:match.start()], match.group(), match.end() - match.start()
+            end = match.end()
+        return
+
+    # Wide characters are words of their own, since e.g. Chinese and Japanese are written without spaces.
+    separator, word, word_width = '', [], 0
+    for char in line:
+        width = char_width(char)
+        if char == ' ' or width == 2:
+            if word:
+                yield separator, ''.join(word), word_width
+                separator, word, word_width = '', [], 0
+            if char == ' ':
+                separator += ' '
+                continue
+            yield separator, char, width
+            separator = ''
+        else:
+            word.append(char)
+            word_width += width
+    if word:
+        yield separator, ''.join(word), word_width
+
+
+def wrap(text, width):
+    for line in iter_lines(text):
+        if width <= 0:
+            yield line
+            continue
+
+        current, current_width = [], 0
+        for separator, word, word_width in iter_words(line):
+            if current and current_width + len(separator) + word_width > width:
+                yield ''.join(current)
+                current, current_width = [], 0
+            if current:
+                current.append(separator)
+                current_width += len(separator)
+            current.append(word)
+            current_width += word_width
+        yield ''.join(current)
+
+
+def wrap_page(text, width, max_lines, page=0):
+    if max_lines <= 0:
+        return '\n'.join(wrap(text, width)), False
+    # Wrapping is lazy and stops after the requested page, so the rest of a huge result is never wrapped.
+    lines = list(islice(wrap(text, width), page * max_lines, (page + 1) * max_lines + 1))
+    return '\n'.join(lines[:max_lines]), len(lines) > max_lines